@@ -0,0 +1,85 @@
+# devices.py
+"""
+Registro de controladores ESP32 (uno por sector del jardín).
+
+Se carga de un JSON (ESP_DEVICES_FILE, por defecto devices.json):
+
+    {
+      "default": "frente",
+      "devices": [
+        {"id": "frente", "host": "http://192.168.0.50", "user": "admin", "pass": "1234"},
+        {"id": "fondo", "host": "http://192.168.0.51", "user": "admin", "pass": "1234",
+         "zones": ["zona1", "zona2"]}
+      ]
+    }
+
+Si el archivo no existe queda un único dispositivo "default" armado con
+ESP_HOST/ESP_USER/ESP_PASS, así una instalación con un solo ESP sigue
+funcionando igual que antes.
+"""
+import os
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from .registry import Registry
+
+
+# === Config del ESP (instalación de un solo dispositivo) ===
+ESP_HOST = os.getenv("ESP_HOST", "http://192.168.0.50")
+ESP_USER = os.getenv("ESP_USER", "admin")
+ESP_PASS = os.getenv("ESP_PASS", "1234")
+
+ESP_DEVICES_FILE = os.getenv("ESP_DEVICES_FILE", "devices.json")
+
+
+@dataclass
+class Device:
+    id: str
+    host: str
+    user: str = ESP_USER
+    password: str = ESP_PASS
+    name: str = ""
+    # Zonas conocidas; si está vacío se leen de config_riego.json del ESP
+    zones: list[str] = field(default_factory=list)
+
+
+class UnknownDevice(Exception):
+    def __init__(self, device_id: str):
+        super().__init__(f"Dispositivo '{device_id}' no registrado")
+        self.device_id = device_id
+
+
+def _parse(item: dict) -> Device:
+    return Device(
+        id=item["id"],
+        host=item["host"],
+        user=item.get("user", ESP_USER),
+        password=item.get("pass", ESP_PASS),
+        name=item.get("name", ""),
+        zones=list(item.get("zones", [])),
+    )
+
+
+_registry = Registry(ESP_DEVICES_FILE, "devices", "dispositivos", _parse,
+                     lambda: Device("default", ESP_HOST), UnknownDevice)
+
+
+def load(path: str | Path = ESP_DEVICES_FILE):
+    _registry.load(path)
+
+
+def all_devices() -> list[Device]:
+    return _registry.all()
+
+
+def default_id() -> str:
+    return _registry.default_id()
+
+
+def get_device(device_id: str | None = None) -> Device:
+    """Devuelve el dispositivo; None = el dispositivo por defecto."""
+    return _registry.get(device_id)
+
+
+def resolve(device_id: str | None = None) -> str:
+    return get_device(device_id).id
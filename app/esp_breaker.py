@@ -0,0 +1,144 @@
+# esp_breaker.py
+"""
+Circuit breaker por dispositivo.
+
+Cuando el ESP se reinicia o se cae de la WiFi cada llamada esperaba el
+timeout completo y los reintentos de la UI se apilaban. Estados:
+    closed    -> normal; se cuentan fallas de transporte seguidas
+    open      -> tras ESP_BREAKER_FAILURES fallas: se responde al instante
+                 con EspUnavailable (503) hasta que pase el intervalo de prueba
+    half_open -> pasa una sola llamada de prueba; si anda se cierra,
+                 si falla vuelve a open
+Solo cuentan errores de transporte (timeout, conexión): un 500 del
+firmware significa que el ESP está vivo.
+"""
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import httpx
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+ESP_BREAKER_FAILURES = int(os.getenv("ESP_BREAKER_FAILURES", "3"))
+ESP_BREAKER_PROBE_S = float(os.getenv("ESP_BREAKER_PROBE_S", "10"))
+
+
+class EspUnavailable(Exception):
+    def __init__(self, retry_after: int, last_error: str | None = None):
+        super().__init__("ESP no disponible (circuito abierto)")
+        self.retry_after = retry_after
+        self.last_error = last_error
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = ESP_BREAKER_FAILURES,
+                 probe_interval: float = ESP_BREAKER_PROBE_S):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: str | None = None
+        self.last_change = time.time()
+        self.short_circuited = 0
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.last_change = time.time()
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.opened_at + self.probe_interval - time.monotonic()))
+
+    def before_call(self) -> bool:
+        """Deja pasar la llamada o tira EspUnavailable; True si es la llamada de prueba."""
+        if self.state == CLOSED:
+            return False
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.probe_interval:
+            # Este pedido es la prueba; el resto sigue fallando rápido
+            self._set_state(HALF_OPEN)
+            return True
+        self.short_circuited += 1
+        raise EspUnavailable(self._retry_after(), self.last_error)
+
+    def recheck(self, probe: bool) -> bool:
+        """
+        Segundo control, ya con el turno de la cola: si el circuito se abrió
+        mientras el pedido esperaba, falla rápido en vez de ir al ESP caído.
+        """
+        if self.state == CLOSED or (probe and self.state == HALF_OPEN):
+            return probe
+        return self.before_call()
+
+    def record_success(self):
+        self.failures = 0
+        self._set_state(CLOSED)
+
+    def record_failure(self, error: Exception):
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._set_state(OPEN)
+
+    @asynccontextmanager
+    async def guard(self):
+        """Envuelve una llamada; lo que devuelve se llama justo antes de ir al ESP (recheck)."""
+        probe = self.before_call()
+
+        def check():
+            nonlocal probe
+            probe = self.recheck(probe)
+
+        try:
+            yield check
+        except httpx.TransportError as e:
+            self.record_failure(e)
+            raise
+        except httpx.HTTPError:
+            # El ESP respondió (status, body que no se pudo decodificar): está vivo
+            self.record_success()
+            raise
+        except BaseException:
+            # No llegó al ESP (429, cancelación, recheck...): si era la prueba,
+            # habilitar otra ya; cualquier otro pedido no toca el estado
+            if probe and self.state == HALF_OPEN:
+                self.opened_at = time.monotonic() - self.probe_interval
+                self._set_state(OPEN)
+            raise
+        else:
+            self.record_success()
+
+    def snapshot(self) -> dict:
+        snap = {
+            "state": self.state,
+            "failures": self.failures,
+            "failure_threshold": self.failure_threshold,
+            "probe_interval_s": self.probe_interval,
+            "last_error": self.last_error,
+            "since": datetime.fromtimestamp(self.last_change).isoformat(timespec="seconds"),
+            "short_circuited": self.short_circuited,
+        }
+        if self.state == OPEN:
+            snap["next_probe_in_s"] = self._retry_after()
+        return snap
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(device: str) -> CircuitBreaker:
+    breaker = _breakers.get(device)
+    if breaker is None:
+        breaker = _breakers[device] = CircuitBreaker()
+    return breaker
+
+
+def snapshot(device_ids: list[str]) -> dict:
+    return {device: get_breaker(device).snapshot() for device in device_ids}
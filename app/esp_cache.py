@@ -0,0 +1,154 @@
+# esp_cache.py
+"""
+Coalescing (single-flight) + cache TTL para las lecturas del ESP.
+
+Con varias pestañas abiertas llegan varios /ls, /cat o /tail idénticos a
+la vez y el ESP (que atiende de a uno) termina dando timeout. Acá:
+  - los GET idénticos concurrentes comparten una sola llamada en vuelo
+  - las respuestas OK quedan en un cache LRU acotado con TTL por ruta
+  - las escrituras (rm, upload, zone) invalidan las entradas afectadas
+  - con el circuito abierto se sirve la última respuesta buena (stale)
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+
+from . import devices, esp_client
+from .esp_breaker import EspUnavailable
+from .esp_client import parse_route_values
+
+
+# TTL (segundos) por ruta de lectura del firmware. Rutas fuera de esta
+# tabla no se cachean (igual se coalescen si pasan por cached_get).
+ESP_CACHE_TTLS = {
+    "/ls": 5.0,
+    "/cat": 5.0,
+    "/tail": 2.0,
+    **parse_route_values(os.getenv("ESP_CACHE_TTLS", "")),
+}
+ESP_CACHE_MAX_ENTRIES = int(os.getenv("ESP_CACHE_MAX_ENTRIES", "256"))
+
+# Header que marca una respuesta servida desde cache con el ESP caído
+STALE_HEADER = "X-Esp-Stale"
+
+stats = {"hits": 0, "misses": 0, "coalesced": 0, "stale": 0}
+
+
+def _key(device_id: str, path: str, params: dict | None):
+    return (device_id, path, tuple(sorted((params or {}).items())))
+
+
+class TTLCache:
+    """LRU acotado por cantidad de entradas, cada una con su vencimiento.
+    Las entradas vencidas no se borran al leer: quedan como "última
+    respuesta buena" hasta que el LRU las desaloje o se invaliden."""
+
+    def __init__(self, max_entries: int = ESP_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if time.monotonic() >= expires_at:
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def get_stale(self, key):
+        item = self._data.get(key)
+        return item[1] if item is not None else None
+
+    def set(self, key, value, ttl: float):
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def invalidate(self, device_id: str, path: str, value: str | None = None):
+        """Borra las entradas de `path` en el dispositivo; si se pasa `value`,
+        solo las que tengan ese valor en algún parámetro (ej. el archivo)."""
+        for key in list(self._data):
+            key_device, key_path, key_params = key
+            if key_device != device_id or key_path != path:
+                continue
+            if value is None or any(v == value for _, v in key_params):
+                del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SingleFlight:
+    """Comparte una única llamada en vuelo entre pedidos con la misma key."""
+
+    def __init__(self):
+        self._inflight: dict = {}
+
+    async def do(self, key, fn):
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t: self._inflight.pop(key, None))
+        else:
+            stats["coalesced"] += 1
+        # shield: si un cliente se desconecta no cancelamos la llamada de los demás
+        return await asyncio.shield(task)
+
+
+_cache = TTLCache()
+_flight = SingleFlight()
+
+
+async def cached_get(path: str, params: dict | None = None, device: str | None = None) -> httpx.Response:
+    device_id = devices.resolve(device)
+    key = _key(device_id, path, params)
+    ttl = ESP_CACHE_TTLS.get(path)
+    if ttl:
+        hit = _cache.get(key)
+        if hit is not None:
+            stats["hits"] += 1
+            return hit
+    stats["misses"] += 1
+
+    try:
+        r = await _flight.do(key, lambda: esp_client.esp_get(path, params, device_id))
+    except EspUnavailable:
+        stale = _cache.get_stale(key) if ttl else None
+        if stale is None:
+            raise
+        stats["stale"] += 1
+        return _mark_stale(stale)
+    if ttl and r.is_success:
+        _cache.set(key, r, ttl)
+    return r
+
+
+def _mark_stale(r: httpx.Response) -> httpx.Response:
+    # Copia (el objeto cacheado se comparte) con el header de stale
+    return httpx.Response(
+        status_code=r.status_code,
+        headers={"content-type": r.headers.get("content-type", ""), STALE_HEADER: "1"},
+        content=r.content,
+    )
+
+
+def invalidate(path: str, value: str | None = None, device: str | None = None):
+    _cache.invalidate(devices.resolve(device), path, value)
+
+
+def invalidate_file(filename: str | None, device: str | None = None):
+    """Un archivo cambió en el ESP (rm/upload): el listado y sus lecturas ya no valen."""
+    invalidate("/ls", device=device)
+    if filename:
+        invalidate("/cat", filename, device)
+        invalidate("/tail", filename, device)
@@ -0,0 +1,162 @@
+# esp_client.py
+"""
+Cliente HTTP compartido hacia los ESP32.
+
+Un httpx.AsyncClient con pool keep-alive por dispositivo vive lo mismo que
+la app (se abre/cierra en el lifespan de FastAPI), así no pagamos un
+handshake TCP por la WiFi en cada llamada a /api/esp/*.
+"""
+import os
+import time
+from urllib.parse import urlencode
+
+import httpx
+
+from . import devices, metrics
+from .devices import Device
+from .esp_breaker import get_breaker
+from .esp_scheduler import get_scheduler, lane_for
+
+
+ESP_TIMEOUT = float(os.getenv("ESP_TIMEOUT", "5"))
+
+# === Config del pool ===
+# El firmware acepta hasta HTTP_MAX_CONNECTIONS (4) conexiones y rechaza
+# el resto con 503, no tiene sentido abrir más
+ESP_MAX_CONNECTIONS = int(os.getenv("ESP_MAX_CONNECTIONS", "4"))
+ESP_MAX_KEEPALIVE = int(os.getenv("ESP_MAX_KEEPALIVE", "2"))
+# Menor que HTTP_IDLE_S del firmware (30 s): la conexión se suelta antes de
+# que el ESP la cierre, así nunca se reusa una que ya está cerrada
+ESP_KEEPALIVE_EXPIRY = float(os.getenv("ESP_KEEPALIVE_EXPIRY", "20"))
+ESP_CONNECT_TIMEOUT = float(os.getenv("ESP_CONNECT_TIMEOUT", "3"))
+# Reintentos solo ante errores de conexión (ConnectError/ConnectTimeout),
+# nunca se reenvía un request que ya llegó al ESP.
+ESP_CONNECT_RETRIES = int(os.getenv("ESP_CONNECT_RETRIES", "2"))
+# El firmware comprime (deflate/gzip) /tail, /cat, /ls... si se lo pedimos;
+# httpx lo descomprime solo. Vacío = sin compresión.
+ESP_ACCEPT_ENCODING = os.getenv("ESP_ACCEPT_ENCODING", "deflate, gzip")
+
+
+def parse_route_values(raw: str) -> dict[str, float]:
+    """'/zone=3,/execute=15' -> {"/zone": 3.0, "/execute": 15.0}"""
+    values = {}
+    for item in raw.split(","):
+        if "=" not in item:
+            continue
+        route, value = item.split("=", 1)
+        try:
+            values[route.strip()] = float(value)
+        except ValueError:
+            continue
+    return values
+
+
+# Timeout (de lectura) por ruta del firmware; el resto usa ESP_TIMEOUT
+ESP_ROUTE_TIMEOUTS = {
+    "/zone": 3.0,
+    "/batch": 3.0,
+    "/execute": 15.0,
+    "/upload": 30.0,
+    "/cat": 10.0,
+    "/tail": 10.0,
+    **parse_route_values(os.getenv("ESP_ROUTE_TIMEOUTS", "")),
+}
+
+_clients: dict[str, httpx.AsyncClient] = {}
+
+
+def build_client(device: Device) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=ESP_MAX_CONNECTIONS,
+        max_keepalive_connections=ESP_MAX_KEEPALIVE,
+        keepalive_expiry=ESP_KEEPALIVE_EXPIRY,
+    )
+    transport = httpx.AsyncHTTPTransport(limits=limits, retries=ESP_CONNECT_RETRIES)
+    return httpx.AsyncClient(
+        base_url=device.host,
+        auth=httpx.BasicAuth(device.user, device.password),
+        headers={"Accept-Encoding": ESP_ACCEPT_ENCODING or "identity"},
+        timeout=httpx.Timeout(ESP_TIMEOUT, connect=ESP_CONNECT_TIMEOUT),
+        transport=transport,
+    )
+
+
+async def start():
+    for dev in devices.all_devices():
+        get_client(dev.id)
+
+
+async def stop():
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def get_client(device_id: str) -> httpx.AsyncClient:
+    # Se crea on-demand también por si se usa la app sin lifespan (scripts sueltos)
+    client = _clients.get(device_id)
+    if client is None:
+        client = _clients[device_id] = build_client(devices.get_device(device_id))
+    return client
+
+
+def route_timeout(path: str) -> httpx.Timeout:
+    read = ESP_ROUTE_TIMEOUTS.get(path, ESP_TIMEOUT)
+    return httpx.Timeout(read, connect=ESP_CONNECT_TIMEOUT)
+
+
+def _url(path: str, params: dict | None) -> str:
+    # Armamos la query a mano (urlencode) como siempre: el firmware no
+    # entiende todas las variantes de escape.
+    if params:
+        return f"{path}?{urlencode(params)}"
+    return path
+
+
+async def _request(method: str, path: str, params: dict | None = None,
+                   device: str | None = None, **kwargs) -> httpx.Response:
+    device_id = devices.resolve(device)
+    client = get_client(device_id)
+    # Circuit breaker primero (si el ESP está caído fallamos sin encolar),
+    # después la cola del dispositivo: las válvulas se atienden primero.
+    # Con el turno ya tomado se vuelve a mirar el breaker: lo encolado
+    # antes de que se abriera falla rápido en vez de esperar el timeout.
+    async with get_breaker(device_id).guard() as recheck:
+        async with get_scheduler(device_id).slot(lane_for(path)):
+            recheck()
+            return await _timed_request(client, device_id, method, path, params, **kwargs)
+
+
+async def _timed_request(client: httpx.AsyncClient, device_id: str, method: str, path: str,
+                         params: dict | None, **kwargs) -> httpx.Response:
+    labels = {"device": device_id, "route": path}
+    metrics.gauge_add("esp_upstream_in_flight", 1, {"device": device_id})
+    t0 = time.perf_counter()
+    try:
+        r = await client.request(method, _url(path, params), timeout=route_timeout(path), **kwargs)
+    except httpx.TimeoutException:
+        metrics.inc("esp_upstream_timeouts_total", labels)
+        raise
+    except httpx.ConnectError:
+        metrics.inc("esp_upstream_connect_errors_total", labels)
+        raise
+    finally:
+        metrics.gauge_add("esp_upstream_in_flight", -1, {"device": device_id})
+        metrics.observe("esp_upstream_duration_seconds", time.perf_counter() - t0, labels)
+    metrics.inc("esp_upstream_responses_total", {**labels, "status": str(r.status_code)})
+    # Por la WiFi (comprimido) vs. lo que queda después de descomprimir
+    metrics.inc("esp_upstream_wire_bytes_total", labels, r.num_bytes_downloaded)
+    metrics.inc("esp_upstream_body_bytes_total", labels, len(r.content))
+    return r
+
+
+async def esp_get(path: str, params: dict | None = None, device: str | None = None) -> httpx.Response:
+    return await _request("GET", path, params, device)
+
+
+async def esp_post(path: str, params: dict | None = None, data: str = "",
+                   device: str | None = None) -> httpx.Response:
+    # El firmware lee el body como texto (no JSON)
+    headers = {"Content-Type": "text/plain; charset=utf-8"}
+    return await _request("POST", path, params, device, content=data.encode("utf-8"), headers=headers)
@@ -0,0 +1,164 @@
+# esp_mirror.py
+"""
+Espejo en memoria del estado de cada ESP.
+
+Una tarea de fondo por dispositivo consulta /status (zonas, tamaño de
+log.txt) y /ls en un intervalo adaptativo: arranca en MIRROR_MIN_S,
+se duplica mientras nada cambie hasta MIRROR_MAX_S y vuelve al mínimo
+apenas algo cambia o llega un comando (nudge). La UI lee el snapshot
+desde /api/state sin tocar el ESP: la carga sobre el micro es una sola,
+constante, sin importar cuántos usuarios haya conectados.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+
+from fastapi import APIRouter, HTTPException, Query
+
+from . import devices, esp_cache, esp_client
+
+
+MIRROR_ENABLED = os.getenv("MIRROR_ENABLED", "1") == "1"
+MIRROR_MIN_S = float(os.getenv("MIRROR_MIN_S", "2"))
+MIRROR_MAX_S = float(os.getenv("MIRROR_MAX_S", "60"))
+
+SECTIONS = ("zones", "files", "log")
+
+
+def _iso(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts).isoformat(timespec="milliseconds") if ts else None
+
+
+class Section:
+    def __init__(self):
+        self.data = None
+        self.version = 0
+        self.as_of: float | None = None
+        self.changed_at: float | None = None
+
+    def update(self, data, now: float) -> bool:
+        self.as_of = now
+        if data == self.data:
+            return False
+        self.data = data
+        self.version += 1
+        self.changed_at = now
+        return True
+
+    def to_dict(self) -> dict:
+        return {"version": self.version, "as_of": _iso(self.as_of),
+                "changed_at": _iso(self.changed_at), "data": self.data}
+
+
+class DeviceMirror:
+    def __init__(self, device_id: str):
+        self.device_id = device_id
+        self.sections = {name: Section() for name in SECTIONS}
+        self.interval = MIRROR_MIN_S
+        self.last_error: str | None = None
+        self.polls = 0
+        self._wake = asyncio.Event()
+        self._task: asyncio.Task | None = None
+
+    def nudge(self):
+        """Hubo un comando: volver a consultar pronto y seguido."""
+        self.interval = MIRROR_MIN_S
+        self._wake.set()
+
+    async def poll(self) -> bool:
+        now = time.time()
+        r = await esp_client.esp_get("/status", device=self.device_id)
+        r.raise_for_status()
+        status = r.json()
+        changed = self.sections["zones"].update(status.get("zones"), now)
+        changed |= self.sections["log"].update({"size": status.get("log_size")}, now)
+
+        # /ls por el cache: de paso queda caliente para la UI
+        r = await esp_cache.cached_get("/ls", device=self.device_id)
+        r.raise_for_status()
+        changed |= self.sections["files"].update(r.json().get("files"), now)
+        self.polls += 1
+        return changed
+
+    async def run(self):
+        while True:
+            try:
+                changed = await self.poll()
+                self.last_error = None
+                self.interval = MIRROR_MIN_S if changed else min(self.interval * 2, MIRROR_MAX_S)
+            except Exception as e:
+                # ESP caído o cola llena: seguimos con el último snapshot
+                self.last_error = f"{type(e).__name__}: {e}"
+                self.interval = min(self.interval * 2, MIRROR_MAX_S)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def snapshot(self, section: str | None = None) -> dict:
+        sections = {section: self.sections[section]} if section else self.sections
+        return {
+            "device": self.device_id,
+            "as_of": _iso(min((s.as_of or 0) for s in sections.values()) or None),
+            "interval_s": self.interval,
+            "last_error": self.last_error,
+            "sections": {name: s.to_dict() for name, s in sections.items()},
+        }
+
+
+_mirrors: dict[str, DeviceMirror] = {}
+
+
+def get_mirror(device: str | None = None) -> DeviceMirror:
+    device_id = devices.resolve(device)
+    mirror = _mirrors.get(device_id)
+    if mirror is None:
+        mirror = _mirrors[device_id] = DeviceMirror(device_id)
+    return mirror
+
+
+def nudge(device: str | None = None):
+    if MIRROR_ENABLED:
+        get_mirror(device).nudge()
+
+
+async def start():
+    if not MIRROR_ENABLED:
+        return
+    for dev in devices.all_devices():
+        mirror = get_mirror(dev.id)
+        if mirror._task is None:
+            mirror._task = asyncio.create_task(mirror.run())
+
+
+async def stop():
+    for mirror in _mirrors.values():
+        if mirror._task is not None:
+            mirror._task.cancel()
+            try:
+                await mirror._task
+            except asyncio.CancelledError:
+                pass
+            mirror._task = None
+
+
+# ------------------ ENDPOINTS --------------------------- #
+
+
+mirror_router = APIRouter()
+
+
+@mirror_router.get("/state")
+async def state(device: str | None = Query(None, description="Id del ESP (devices.json)")):
+    """Último snapshot del ESP (zonas, archivos, offset del log) con versión y as_of."""
+    return get_mirror(device).snapshot()
+
+
+@mirror_router.get("/state/{section}")
+async def state_section(section: str,
+                        device: str | None = Query(None, description="Id del ESP (devices.json)")):
+    if section not in SECTIONS:
+        raise HTTPException(status_code=404, detail=f"Sección '{section}' inexistente, usar {SECTIONS}")
+    return get_mirror(device).snapshot(section)
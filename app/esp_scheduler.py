@@ -0,0 +1,153 @@
+# esp_scheduler.py
+"""
+Cola de comandos por dispositivo con carriles de prioridad.
+
+El firmware atiende un request a la vez (handle_client), así que una
+ráfaga de /ls o /cat desde la UI puede demorar un /zone off. Cada ESP
+tiene su scheduler: concurrencia acotada (por defecto 1 en vuelo) y los
+pedidos esperando salen por prioridad:
+    valve   -> /zone, /batch, /reset
+    execute -> /execute
+    files   -> todo lo demás (ls, cat, tail, rm, upload)
+Si un carril está lleno se rechaza con QueueFull (-> 429 + Retry-After).
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+
+LANE_VALVE = 0
+LANE_EXECUTE = 1
+LANE_FILES = 2
+LANE_NAMES = {LANE_VALVE: "valve", LANE_EXECUTE: "execute", LANE_FILES: "files"}
+
+ROUTE_LANES = {
+    "/zone": LANE_VALVE,
+    "/batch": LANE_VALVE,
+    "/reset": LANE_VALVE,
+    "/execute": LANE_EXECUTE,
+}
+
+ESP_MAX_IN_FLIGHT = int(os.getenv("ESP_MAX_IN_FLIGHT", "1"))
+# Máximo de pedidos esperando por carril antes de devolver 429
+ESP_QUEUE_LIMITS = {
+    LANE_VALVE: int(os.getenv("ESP_QUEUE_VALVE", "32")),
+    LANE_EXECUTE: int(os.getenv("ESP_QUEUE_EXECUTE", "8")),
+    LANE_FILES: int(os.getenv("ESP_QUEUE_FILES", "8")),
+}
+
+
+def lane_for(path: str) -> int:
+    return ROUTE_LANES.get(path, LANE_FILES)
+
+
+class QueueFull(Exception):
+    def __init__(self, lane: int, retry_after: int):
+        super().__init__(f"cola '{LANE_NAMES[lane]}' llena")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class DeviceScheduler:
+    def __init__(self, max_in_flight: int = ESP_MAX_IN_FLIGHT, limits: dict | None = None):
+        self.max_in_flight = max_in_flight
+        self.limits = dict(limits or ESP_QUEUE_LIMITS)
+        self._in_flight = 0
+        self._waiters = []  # heap de (lane, seq, future)
+        self._seq = itertools.count()
+        self._depth = {lane: 0 for lane in LANE_NAMES}
+        self._service_avg = 0.5  # EWMA del tiempo de servicio (s), para Retry-After
+        self._stats = {
+            lane: {"served": 0, "rejected": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for lane in LANE_NAMES
+        }
+
+    def retry_after(self, lane: int) -> int:
+        ahead = self._in_flight + sum(d for l, d in self._depth.items() if l <= lane)
+        return max(1, math.ceil(ahead * self._service_avg / self.max_in_flight))
+
+    async def _acquire(self, lane: int):
+        if self._in_flight < self.max_in_flight and not any(self._depth.values()):
+            self._in_flight += 1
+            return
+
+        if self._depth[lane] >= self.limits[lane]:
+            self._stats[lane]["rejected"] += 1
+            raise QueueFull(lane, self.retry_after(lane))
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (lane, next(self._seq), fut))
+        self._depth[lane] += 1
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # Ya nos habían dado el lugar: se lo pasamos al siguiente
+                self._release()
+            else:
+                fut.cancel()
+                self._depth[lane] -= 1
+            raise
+
+    def _release(self):
+        while self._waiters:
+            lane, _, fut = heapq.heappop(self._waiters)
+            if fut.cancelled():
+                continue
+            # Traspaso directo: _in_flight no cambia
+            self._depth[lane] -= 1
+            fut.set_result(None)
+            return
+        self._in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, lane: int = LANE_FILES):
+        t0 = time.monotonic()
+        await self._acquire(lane)
+        t1 = time.monotonic()
+        stats = self._stats[lane]
+        stats["served"] += 1
+        stats["wait_total"] += t1 - t0
+        stats["wait_max"] = max(stats["wait_max"], t1 - t0)
+        try:
+            yield
+        finally:
+            self._service_avg = 0.8 * self._service_avg + 0.2 * (time.monotonic() - t1)
+            self._release()
+
+    def snapshot(self) -> dict:
+        lanes = {}
+        for lane, name in LANE_NAMES.items():
+            s = self._stats[lane]
+            lanes[name] = {
+                "depth": self._depth[lane],
+                "limit": self.limits[lane],
+                "served": s["served"],
+                "rejected": s["rejected"],
+                "wait_avg_ms": round(1000 * s["wait_total"] / s["served"], 1) if s["served"] else 0.0,
+                "wait_max_ms": round(1000 * s["wait_max"], 1),
+            }
+        return {
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight,
+            "service_avg_ms": round(1000 * self._service_avg, 1),
+            "lanes": lanes,
+        }
+
+
+_schedulers: dict[str, DeviceScheduler] = {}
+
+
+def get_scheduler(device: str) -> DeviceScheduler:
+    sched = _schedulers.get(device)
+    if sched is None:
+        sched = _schedulers[device] = DeviceScheduler()
+    return sched
+
+
+def snapshot(device_ids: list[str]) -> dict:
+    return {device: get_scheduler(device).snapshot() for device in device_ids}
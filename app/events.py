@@ -0,0 +1,217 @@
+# events.py
+"""
+Eventos de riego estructurados, sacados de las líneas de log.
+
+El writer de logs (log_writer) pasa por acá cada línea nueva; las que
+describen un riego se guardan como eventos tipados en SQLite (EVENTS_DB):
+
+  - "Regando zona X (pin N) de A a B"            -> on,  scheduler (B-A min, +24 h si B < A)
+  - "Riego zona X finalizado"                    -> off, scheduler
+  - "Endpoint: Zona X (pin N) encendida via /zone" -> on,  api
+  - "Endpoint: Zona X (pin N) apagada via /zone"   -> off, api
+  - "Endpoint: Zona X (pin N) apagada por timeout" -> off, timeout
+  - "Endpoint: batch aplicado via /batch: [...]"   -> on/off por zona, batch
+
+Además de los eventos se arman sesiones (encendido -> apagado) por zona,
+así "minutos regados por zona por día" es un GROUP BY sobre un índice
+en vez de recorrer archivos de texto.
+
+Para cargar el historial que ya está en el archivo de logs:
+    python -m app.events --backfill 90
+"""
+import os
+import re
+import sqlite3
+import threading
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+from fastapi import APIRouter, Query
+
+from . import log_archive
+
+
+EVENTS_DB = os.getenv("EVENTS_DB", str(log_archive.LOGS_ROOT / "events.sqlite3"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    ts INTEGER NOT NULL,
+    zone TEXT NOT NULL,
+    pin INTEGER,
+    action TEXT NOT NULL,
+    source TEXT NOT NULL,
+    duration_s INTEGER
+);
+CREATE INDEX IF NOT EXISTS events_zone_ts ON events (zone, ts);
+CREATE INDEX IF NOT EXISTS events_ts ON events (ts);
+CREATE TABLE IF NOT EXISTS sessions (
+    zone TEXT NOT NULL,
+    start INTEGER NOT NULL,
+    end INTEGER,
+    seconds INTEGER,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_start ON sessions (start, zone);
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (zone) WHERE end IS NULL;
+"""
+
+_ZONE = r"(?P<zone>\w+)"
+_PIN = r"\(pin (?P<pin>\d+)\)"
+_PATTERNS = [
+    (re.compile(rf"Regando zona {_ZONE} {_PIN} de (?P<a>\d+) a (?P<b>\d+)"), "on", "scheduler"),
+    (re.compile(rf"Riego zona {_ZONE} finalizado"), "off", "scheduler"),
+    (re.compile(rf"Endpoint: Zona {_ZONE} {_PIN} encendida via /zone"), "on", "api"),
+    (re.compile(rf"Endpoint: Zona {_ZONE} {_PIN} apagada via /zone"), "off", "api"),
+    (re.compile(rf"Endpoint: Zona {_ZONE} {_PIN} apagada por timeout"), "off", "timeout"),
+]
+_BATCH = re.compile(r"Endpoint: batch aplicado via /batch: (?P<ops>.*)")
+_BATCH_OP = re.compile(r"\('(\w+)', '(on|off)'\)")
+
+
+def parse_line(day: date, line: str) -> list[tuple]:
+    """Eventos (ts, zone, pin, action, source, duration_s) de una línea de log."""
+    seconds = log_archive.line_seconds(line[:11].encode())
+    if seconds is None:
+        return []
+    ts = int(datetime.combine(day, time(seconds // 3600, seconds // 60 % 60, seconds % 60)).timestamp())
+    msg = line[11:]
+
+    m = _BATCH.match(msg)
+    if m:
+        return [(ts, zone, None, action, "batch", None) for zone, action in _BATCH_OP.findall(m["ops"])]
+
+    for pattern, action, source in _PATTERNS:
+        m = pattern.match(msg)
+        if m:
+            groups = m.groupdict()
+            pin = int(groups["pin"]) if groups.get("pin") else None
+            # El scheduler loguea el período en minutos del día; si cruza la
+            # medianoche (ej. 23:55-00:10) el fin es del día siguiente
+            duration = (int(groups["b"]) - int(groups["a"])) % (24 * 60) * 60 if groups.get("a") else None
+            return [(ts, groups["zone"], pin, action, source, duration)]
+    return []
+
+
+# ---------- Store ----------
+
+
+class EventStore:
+    def __init__(self, path: str = EVENTS_DB):
+        self.path = path
+        self._db: sqlite3.Connection | None = None
+        # Escribe el thread del log_writer, leen los endpoints (en threads)
+        self._lock = threading.Lock()
+
+    def _conn(self) -> sqlite3.Connection:
+        if self._db is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def ingest(self, day: date, lines: list[str]) -> int:
+        events = [ev for line in lines for ev in parse_line(day, line)]
+        if not events:
+            return 0
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)", events)
+                for ts, zone, _, action, source, _ in events:
+                    self._session(db, ts, zone, action, source)
+        return len(events)
+
+    @staticmethod
+    def _session(db, ts, zone, action, source):
+        open_start = db.execute("SELECT start FROM sessions WHERE zone = ? AND end IS NULL",
+                                (zone,)).fetchone()
+        if action == "on":
+            if open_start is None:
+                db.execute("INSERT INTO sessions (zone, start, source) VALUES (?, ?, ?)", (zone, ts, source))
+        elif open_start is not None:
+            db.execute("UPDATE sessions SET end = ?, seconds = ? WHERE zone = ? AND end IS NULL",
+                       (ts, max(0, ts - open_start[0]), zone))
+
+    def clear_day(self, day: date):
+        start = int(datetime.combine(day, time.min).timestamp())
+        end = int(datetime.combine(day + timedelta(days=1), time.min).timestamp())
+        with self._lock:
+            db = self._conn()
+            with db:
+                db.execute("DELETE FROM events WHERE ts >= ? AND ts < ?", (start, end))
+                db.execute("DELETE FROM sessions WHERE start >= ? AND start < ?", (start, end))
+
+    def query(self, sql: str, params: tuple = ()) -> list[dict]:
+        with self._lock:
+            cur = self._conn().execute(sql, params)
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+
+store = EventStore()
+
+
+def backfill(days: int, today: date | None = None) -> dict:
+    """Rearma eventos y sesiones de los últimos `days` días desde el archivo de logs."""
+    today = today or date.today()
+    counts = {}
+    for i in range(days, -1, -1):
+        day = today - timedelta(days=i)
+        reader = log_archive.open_day(day)
+        if reader is None:
+            continue
+        store.clear_day(day)
+        with reader:
+            lines = [raw.decode(errors="replace") for _, _, raw in log_archive.iter_lines(reader, 0, reader.size)]
+        counts[day.isoformat()] = store.ingest(day, lines)
+    return counts
+
+
+# ------------------ ENDPOINTS --------------------------- #
+
+
+events_router = APIRouter()
+
+
+@events_router.get("/events")
+def list_events(from_: datetime = Query(..., alias="from"), to: datetime | None = Query(None),
+                zone: str | None = Query(None), limit: int = Query(500, ge=1, le=10000)):
+    """Eventos de riego en [from, to], opcionalmente de una zona."""
+    to = to or datetime.now()
+    sql = "SELECT ts, zone, pin, action, source, duration_s FROM events WHERE ts BETWEEN ? AND ?"
+    params = [int(from_.timestamp()), int(to.timestamp())]
+    if zone:
+        sql += " AND zone = ?"
+        params.append(f"zona{zone}" if zone.isdigit() else zone)
+    rows = store.query(sql + " ORDER BY ts LIMIT ?", (*params, limit))
+    for row in rows:
+        row["ts"] = datetime.fromtimestamp(row["ts"]).isoformat()
+    return {"events": rows}
+
+
+@events_router.get("/events/watering")
+def watering_minutes(days: int = Query(90, ge=1, le=3650), zone: str | None = Query(None)):
+    """Minutos regados por zona y por día en los últimos `days` días."""
+    since = int(datetime.combine(date.today() - timedelta(days=days - 1), time.min).timestamp())
+    sql = ("SELECT zone, date(start, 'unixepoch', 'localtime') AS day, "
+           "ROUND(SUM(seconds) / 60.0, 1) AS minutes, COUNT(*) AS sessions "
+           "FROM sessions WHERE start >= ? AND end IS NOT NULL")
+    params = [since]
+    if zone:
+        sql += " AND zone = ?"
+        params.append(f"zona{zone}" if zone.isdigit() else zone)
+    rows = store.query(sql + " GROUP BY zone, day ORDER BY day, zone", tuple(params))
+    by_zone: dict = {}
+    for row in rows:
+        by_zone.setdefault(row["zone"], {})[row["day"]] = row["minutes"]
+    return {"days": days, "minutes": by_zone}
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Carga eventos de riego desde el archivo de logs")
+    parser.add_argument("--backfill", type=int, default=90, metavar="DIAS")
+    print(json.dumps(backfill(parser.parse_args().backfill), indent=2))
@@ -0,0 +1,111 @@
+# fleet.py
+"""
+Operaciones sobre toda la flota de ESP32.
+
+Cada operación corre en paralelo en todos los dispositivos
+(asyncio.gather) con un tope global de concurrencia, y devuelve el
+resultado por dispositivo: un ESP caído no tira abajo a los demás.
+"""
+import asyncio
+import json
+import os
+
+import httpx
+from fastapi import APIRouter
+
+from . import devices, esp_cache, esp_client, esp_mirror
+from .devices import Device
+
+
+FLEET_CONCURRENCY = int(os.getenv("FLEET_CONCURRENCY", "4"))
+CONFIG_RIEGO = "config_riego.json"
+
+_fleet_sem: asyncio.Semaphore | None = None
+
+
+def _semaphore() -> asyncio.Semaphore:
+    global _fleet_sem
+    if _fleet_sem is None:
+        _fleet_sem = asyncio.Semaphore(FLEET_CONCURRENCY)
+    return _fleet_sem
+
+
+def _result(r: httpx.Response) -> dict:
+    try:
+        body = r.json()
+    except ValueError:
+        body = r.text
+    return {"ok": r.is_success, "status": r.status_code, "body": body}
+
+
+async def fan_out(fn, targets: list[Device] | None = None) -> dict:
+    """Corre `fn(device)` en todos los dispositivos y junta los resultados."""
+    targets = targets if targets is not None else devices.all_devices()
+    sem = _semaphore()
+
+    async def one(dev: Device):
+        async with sem:
+            try:
+                return dev.id, await fn(dev)
+            except Exception as e:
+                return dev.id, {"ok": False, "error": f"{type(e).__name__}: {e}"}
+
+    results = dict(await asyncio.gather(*(one(dev) for dev in targets)))
+    ok = sum(1 for res in results.values() if res.get("ok"))
+    return {"ok": ok, "failed": len(results) - ok, "results": results}
+
+
+async def device_zones(dev: Device) -> list[str]:
+    """Zonas del dispositivo: las del registro o las de su config_riego.json."""
+    if dev.zones:
+        return dev.zones
+    r = await esp_cache.cached_get("/cat", {"filename": CONFIG_RIEGO}, dev.id)
+    r.raise_for_status()
+    cfg = json.loads(r.json()["content"])
+    return list(cfg.get("zones", {}))
+
+
+# ------------------ ENDPOINTS --------------------------- #
+
+
+fleet_router = APIRouter()
+
+
+@fleet_router.post("/fleet/zones/off")
+async def fleet_zones_off():
+    """Apaga todas las zonas de todos los ESP."""
+    async def all_off(dev: Device):
+        zones = await device_zones(dev)
+        if not zones:
+            # Nada que apagar; el firmware rechaza un /batch sin ops
+            return {"device": dev.id, "ok": True, "zones": []}
+        # Un solo viaje por ESP con /batch
+        data = json.dumps({"ops": [{"zone": zone, "action": "off"} for zone in zones]})
+        r = await esp_client.esp_post("/batch", data=data, device=dev.id)
+        esp_cache.invalidate("/tail", device=dev.id)
+        esp_mirror.nudge(dev.id)
+        if r.status_code != 404:
+            return {**_result(r), "zones": zones}
+
+        # Firmware viejo sin /batch: zona por zona
+        results = {}
+        for zone in zones:
+            try:
+                r = await esp_client.esp_get("/zone", {"zone": zone, "action": "off"}, dev.id)
+                results[zone] = _result(r)
+            except Exception as e:
+                results[zone] = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+        return {"ok": all(z["ok"] for z in results.values()), "zones": results}
+
+    return await fan_out(all_off)
+
+
+@fleet_router.get("/fleet/ls")
+async def fleet_ls(filename: str | None = None):
+    """ls en todos los ESP."""
+    params = {"filename": filename} if filename else None
+
+    async def ls(dev: Device):
+        return _result(await esp_cache.cached_get("/ls", params, dev.id))
+
+    return await fan_out(ls)
@@ -0,0 +1,370 @@
+# log_archive.py
+"""
+Lectura del archivo histórico de logs: LOGS_ROOT/YYYY/MM/DD.log, una
+línea por evento con la forma "HH:MM:SS - mensaje" (hora del ESP).
+
+Búsqueda por rango de tiempo sin recorrer días enteros: por cada .log
+hay un índice ralo DD.log.tix (JSON) que guarda, por bucket de
+LOG_INDEX_BUCKET_S segundos, el offset de la primera línea del bucket y
+el fin de la última. Una consulta abre el archivo con mmap, salta al
+primer offset de los buckets pedidos y recorre solo hasta el último.
+
+Las líneas no vienen necesariamente ordenadas (reinicios del ESP antes
+del NTP, el día del archivo lo pone el server): por eso cada bucket
+guarda primero y último, y cada línea se vuelve a filtrar por hora.
+Las líneas sin hora (ej. un traceback partido en varias) cuentan como
+del bucket de la línea anterior.
+
+El índice del día en curso se extiende solo con lo que se agregó desde
+la última vez (guarda hasta qué byte cubre).
+
+Los días viejos los comprime log_rotate a DD.log.gz: bloques gzip
+independientes de ~LOG_BLOCK_SIZE bytes cortados en fin de línea, con un
+índice DD.log.gz.bix de (offset sin comprimir, offset comprimido, largo).
+open_day() devuelve un lector con la misma interfaz para los dos
+formatos: los offsets son siempre los del texto sin comprimir (el .tix
+sigue sirviendo) y de un .gz solo se descomprimen los bloques pedidos.
+"""
+import bisect
+import json
+import mmap
+import os
+import re
+import threading
+import zlib
+from collections import deque
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+
+
+LOGS_ROOT = Path(os.getenv("LOGS_ROOT", "."))
+LOG_INDEX_BUCKET_S = int(os.getenv("LOG_INDEX_BUCKET_S", "60"))
+LOG_READ_CHUNK = 256 * 1024
+LOG_TAIL_CHUNK = 8 * 1024
+
+_TS = re.compile(rb"^(\d\d):(\d\d):(\d\d) - ")
+
+
+def day_path(day: date) -> Path:
+    return LOGS_ROOT / day.strftime("%Y/%m/%d.log")
+
+
+def block_path(day: date) -> Path:
+    return LOGS_ROOT / day.strftime("%Y/%m/%d.log.gz")
+
+
+def day_of(path: Path) -> date | None:
+    """Día de un LOGS_ROOT/YYYY/MM/DD.log (None si la ruta no tiene esa forma)."""
+    try:
+        return datetime.strptime("/".join(path.relative_to(LOGS_ROOT).parts), "%Y/%m/%d.log").date()
+    except ValueError:
+        return None
+
+
+def line_seconds(line: bytes) -> int | None:
+    """Segundos desde medianoche según el "HH:MM:SS - " de la línea."""
+    m = _TS.match(line)
+    if m is None:
+        return None
+    h, mi, s = (int(g) for g in m.groups())
+    return h * 3600 + mi * 60 + s
+
+
+# ---------- Lectores de un día ----------
+
+
+class PlainDay:
+    """DD.log en texto plano, leído con mmap."""
+
+    def __init__(self, path: Path):
+        self._f = open(path, "rb")
+        stat = os.fstat(self._f.fileno())
+        self.size, self.mtime = stat.st_size, stat.st_mtime
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+
+    def read(self, start: int, stop: int) -> bytes:
+        return self._mm[start:min(stop, self.size)] if self._mm is not None else b""
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class BlockDay(PlainDay):
+    """DD.log.gz por bloques: solo se descomprimen los que se leen."""
+
+    def __init__(self, path: Path):
+        index = json.loads(path.with_name(path.name + ".bix").read_text())
+        self._f = open(path, "rb")
+        self.mtime = os.fstat(self._f.fileno()).st_mtime
+        self._mm = None
+        self.size = index["size"]
+        self.blocks = index["blocks"]  # [offset sin comprimir, offset comprimido, largo]
+        self._starts = [b[0] for b in self.blocks]
+        self._cached: tuple[int, bytes] | None = None
+
+    def _block(self, i: int) -> bytes:
+        if self._cached is None or self._cached[0] != i:
+            _, c_off, c_len = self.blocks[i]
+            self._f.seek(c_off)
+            self._cached = i, zlib.decompress(self._f.read(c_len), 31)
+        return self._cached[1]
+
+    def read(self, start: int, stop: int) -> bytes:
+        stop = min(stop, self.size)
+        out = []
+        i = bisect.bisect_right(self._starts, start) - 1
+        while i < len(self.blocks) and start < stop:
+            u_off = self.blocks[i][0]
+            data = self._block(i)
+            out.append(data[start - u_off:stop - u_off])
+            start = u_off + len(data)
+            i += 1
+        return b"".join(out)
+
+
+def open_day(day: date) -> PlainDay | None:
+    """Lector del día: el .log si existe (día en curso o sin rotar), si no el .gz."""
+    plain = day_path(day)
+    if plain.exists():
+        return PlainDay(plain)
+    packed = block_path(day)
+    if packed.exists():
+        return BlockDay(packed)
+    return None
+
+
+def iter_lines(reader: PlainDay, start: int, stop: int):
+    """(offset, fin, línea) de cada línea completa en [start, stop)."""
+    base, buf, read_at = start, b"", start
+    while read_at < stop:
+        data = reader.read(read_at, min(read_at + LOG_READ_CHUNK, stop))
+        if not data:
+            break
+        read_at += len(data)
+        buf += data
+        i = 0
+        while True:
+            nl = buf.find(b"\n", i)
+            if nl < 0:
+                break
+            yield base + i, base + nl + 1, buf[i:nl]
+            i = nl + 1
+        buf = buf[i:]
+        base += i
+
+
+def read_last_lines(reader: PlainDay, n: int) -> tuple[list[bytes], int]:
+    """
+    Últimas `n` líneas completas leyendo el archivo de atrás para adelante
+    de a LOG_TAIL_CHUNK bytes, y el offset donde terminan (una línea a
+    medio escribir al final no cuenta).
+    """
+    start, buf = reader.size, b""
+    while start > 0 and buf.count(b"\n") <= n:
+        prev = max(0, start - LOG_TAIL_CHUNK)
+        buf = reader.read(prev, start) + buf
+        start = prev
+    cut = buf.rfind(b"\n") + 1
+    lines = buf[:cut].split(b"\n")[:-1]
+    if start > 0:
+        lines = lines[1:]  # la primera puede estar cortada
+    return lines[-n:] if n else [], start + cut
+
+
+# ---------- Índice ralo por día ----------
+
+
+class TimeIndex:
+    def __init__(self, log_file: Path):
+        self.log_file = log_file
+        self.tix_file = log_file.with_name(log_file.name + ".tix")
+        self.size = 0
+        self.last_bucket = 0
+        self.buckets: dict[int, list[int]] = {}  # bucket -> [primer offset, fin]
+        self._load()
+
+    def _load(self):
+        try:
+            data = json.loads(self.tix_file.read_text())
+        except (OSError, ValueError):
+            return
+        if data.get("bucket_s") != LOG_INDEX_BUCKET_S:
+            return
+        self.size = data["size"]
+        self.last_bucket = data["last_bucket"]
+        self.buckets = {int(b): v for b, v in data["buckets"].items()}
+
+    def _save(self):
+        tmp = self.tix_file.with_name(self.tix_file.name + ".tmp")
+        tmp.write_text(json.dumps({"bucket_s": LOG_INDEX_BUCKET_S, "size": self.size,
+                                   "last_bucket": self.last_bucket, "buckets": self.buckets}))
+        tmp.replace(self.tix_file)
+
+    def refresh(self, reader: PlainDay):
+        """Indexa lo que se haya agregado al .log desde la última vez."""
+        if reader.size < self.size:
+            # El archivo se achicó: se reescribió, índice de cero
+            self.size, self.last_bucket, self.buckets = 0, 0, {}
+        end = self.size
+        for pos, end, raw in iter_lines(reader, self.size, reader.size):
+            seconds = line_seconds(raw[:11])
+            if seconds is not None:
+                self.last_bucket = seconds // LOG_INDEX_BUCKET_S
+            entry = self.buckets.get(self.last_bucket)
+            if entry is None:
+                self.buckets[self.last_bucket] = [pos, end]
+            else:
+                entry[1] = end
+        # Una última línea a medio escribir queda para la próxima
+        if end != self.size:
+            self.size = end
+            self._save()
+
+    def span(self, start_s: int, end_s: int) -> tuple[int, int] | None:
+        """Región [desde, hasta) del .log que contiene las líneas de [start_s, end_s]."""
+        lo, hi = start_s // LOG_INDEX_BUCKET_S, end_s // LOG_INDEX_BUCKET_S
+        hits = [v for b, v in self.buckets.items() if lo <= b <= hi]
+        if not hits:
+            return None
+        return min(v[0] for v in hits), max(v[1] for v in hits)
+
+
+_indexes: dict[Path, TimeIndex] = {}
+_lock = threading.Lock()
+
+
+def time_index(log_file: Path, reader: PlainDay) -> TimeIndex:
+    """Índice de `log_file` (la ruta .log, aunque esté rotado) al día con `reader`."""
+    # La búsqueda corre en threads (StreamingResponse con generador sync)
+    with _lock:
+        index = _indexes.get(log_file)
+        if index is None:
+            index = _indexes[log_file] = TimeIndex(log_file)
+        index.refresh(reader)
+        return index
+
+
+# ---------- Búsqueda ----------
+
+
+def zone_pattern(zones: list[str]) -> re.Pattern:
+    names = [f"zona{z}" if z.isdigit() else z for z in zones]
+    return re.compile(r"\b(" + "|".join(re.escape(n) for n in names) + r")\b", re.IGNORECASE)
+
+
+def encode_cursor(day: date, offset: int) -> str:
+    return f"{day.isoformat()}:{offset}"
+
+
+def decode_cursor(cursor: str) -> tuple[date, int]:
+    day, _, offset = cursor.partition(":")
+    return date.fromisoformat(day), int(offset)
+
+
+def search(start: datetime, end: datetime, text: str | None = None,
+           pattern: re.Pattern | None = None, zones: re.Pattern | None = None,
+           cursor: str | None = None):
+    """
+    Genera (datetime, línea, cursor) de las líneas en [start, end] que
+    cumplen los filtros, en orden de día y de archivo. `cursor` (el de
+    una línea ya entregada) retoma justo después de ella.
+    """
+    day, resume = start.date(), 0
+    if cursor:
+        day, resume = decode_cursor(cursor)
+    while day <= end.date():
+        reader = open_day(day)
+        if reader is not None:
+            with reader:
+                day_start = start.time() if day == start.date() else time.min
+                day_end = end.time() if day == end.date() else time.max
+                from_s = day_start.hour * 3600 + day_start.minute * 60 + day_start.second
+                to_s = day_end.hour * 3600 + day_end.minute * 60 + day_end.second
+                span = time_index(day_path(day), reader).span(from_s, to_s)
+                if span is not None:
+                    yield from _scan(reader, day, max(span[0], resume), span[1],
+                                     from_s, to_s, text, pattern, zones)
+        day += timedelta(days=1)
+        resume = 0
+
+
+def _seconds_before(reader: PlainDay, pos: int, window: int = 16 * 1024) -> int | None:
+    """Hora de la última línea con hora antes de `pos` (para arrancar en una continuación)."""
+    for raw in reversed(reader.read(max(0, pos - window), pos).split(b"\n")):
+        seconds = line_seconds(raw[:11])
+        if seconds is not None:
+            return seconds
+    return None
+
+
+def _scan(reader, day, pos, stop, from_s, to_s, text, pattern, zones):
+    needle = text.encode() if text else None
+    seconds = _seconds_before(reader, pos) if pos else None
+    for _, next_pos, raw in iter_lines(reader, pos, stop):
+        line_s = line_seconds(raw[:11])
+        if line_s is not None:
+            seconds = line_s
+        if (seconds is not None and from_s <= seconds <= to_s
+                and (needle is None or needle in raw)):
+            line = raw.decode(errors="replace")
+            if (pattern is None or pattern.search(line)) and (zones is None or zones.search(line)):
+                ts = datetime.combine(day, time(seconds // 3600, seconds // 60 % 60, seconds % 60))
+                yield ts, line, encode_cursor(day, next_pos)
+
+
+# ---------- Tail ----------
+
+
+def tail(n: int, since: str | None = None, today: date | None = None) -> dict:
+    """
+    Últimas `n` líneas del archivo local. Con `since` (un cursor devuelto
+    antes) las posteriores a él, las primeras `n`: el cursor queda en la
+    última devuelta y `more` avisa que hay más. Devuelve las líneas, el
+    cursor para la próxima vez y la hora de la última escritura.
+    """
+    today = today or date.today()
+    lines: deque = deque(maxlen=n)
+    cursor, modified, more = encode_cursor(today, 0), None, False
+
+    if since:
+        # Hacia adelante desde el cursor, pasando al día siguiente si hace falta
+        day, offset = decode_cursor(since)
+        while day <= today and not more:
+            reader = open_day(day)
+            if reader is not None:
+                with reader:
+                    pos = offset if offset <= reader.size else 0  # 0: se reescribió
+                    for _, end, raw in iter_lines(reader, pos, reader.size):
+                        if len(lines) == n:
+                            more = True
+                            break
+                        lines.append(raw)
+                        pos = end
+                    cursor = encode_cursor(day, pos)
+                    if day == today:
+                        modified = reader.mtime
+            day, offset = day + timedelta(days=1), 0
+    else:
+        # De atrás para adelante: hoy y, si no alcanza, ayer
+        for day in (today, today - timedelta(days=1)):
+            reader = open_day(day)
+            if reader is None:
+                continue
+            with reader:
+                found, end = read_last_lines(reader, n - len(lines))
+                lines.extendleft(reversed(found))
+                if day == today:
+                    cursor, modified = encode_cursor(day, end), reader.mtime
+            if len(lines) >= n:
+                break
+
+    return {"lines": [raw.decode(errors="replace") for raw in lines], "cursor": cursor,
+            "more": more, "modified": modified}
@@ -0,0 +1,74 @@
+# log_broadcast.py
+"""
+Fan-out en memoria de las líneas de log que llegan por POST /api/logs.
+
+Cada línea nueva recibe un id y queda en un historial circular; cada
+viewer conectado (SSE) tiene su propia cola acotada. Publicar cuesta lo
+mismo con 1 o con cientos de viewers conectados: no se vuelve a pedir
+nada al ESP.
+
+Los ids tienen la forma "<epoch>-<n>": si el server se reinició, el
+Last-Event-ID de un cliente trae otro epoch y se le reenvía el historial
+completo en vez de saltearse líneas.
+
+Ojo: el broadcaster vive en el proceso. Con varios workers de uvicorn el
+POST y los viewers tienen que caer en el mismo worker (usar --workers 1).
+"""
+import asyncio
+import os
+import time
+from collections import deque
+
+
+LOG_STREAM_HISTORY = int(os.getenv("LOG_STREAM_HISTORY", "1000"))
+LOG_STREAM_QUEUE = int(os.getenv("LOG_STREAM_QUEUE", "256"))
+
+
+class Broadcaster:
+    def __init__(self, history: int = LOG_STREAM_HISTORY, queue_size: int = LOG_STREAM_QUEUE):
+        self.epoch = str(int(time.time()))
+        self.queue_size = queue_size
+        self._seq = 0
+        self._history: deque = deque(maxlen=history)
+        self._subscribers: set[asyncio.Queue] = set()
+
+    def publish(self, lines: list[str]):
+        for line in lines:
+            self._seq += 1
+            event = (f"{self.epoch}-{self._seq}", line)
+            self._history.append(event)
+            for queue in list(self._subscribers):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # Viewer lento: lo cortamos (None = fin del stream); al
+                    # reconectar recupera lo que le falte desde el historial
+                    # con su Last-Event-ID
+                    self._subscribers.discard(queue)
+                    queue.get_nowait()
+                    queue.put_nowait(None)
+
+    def replay(self, last_event_id: str | None, backlog: int) -> list:
+        """Eventos que el cliente no vio. Sin id: las últimas `backlog` líneas."""
+        if not last_event_id:
+            return list(self._history)[-backlog:] if backlog else []
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return list(self._history)
+        seq = int(seq)
+        return [ev for ev in self._history if int(ev[0].rsplit("-", 1)[1]) > seq]
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    @property
+    def viewers(self) -> int:
+        return len(self._subscribers)
+
+
+broadcaster = Broadcaster()
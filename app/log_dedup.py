@@ -0,0 +1,134 @@
+# log_dedup.py
+"""
+Índice de líneas ya escritas en el log del día, para no releer el
+archivo entero en cada POST /api/logs.
+
+Por cada YYYY/MM/DD.log hay un sidecar YYYY/MM/DD.log.idx con:
+  - 8 bytes: hasta qué offset del .log está indexado
+  - 8 bytes por línea: hash (blake2b de 64 bits) de la línea
+
+Al primer uso del día se carga el sidecar a un set en memoria y se
+indexa solo lo que el .log tenga más allá del offset guardado (por
+ejemplo si se cortó la luz entre escribir el log y el índice). Si el
+.log es más chico que el offset (lo truncaron o lo reemplazaron) el
+índice se rearma de cero. Después, cada batch cuesta O(batch) sin
+importar el tamaño del archivo.
+
+En memoria quedan solo los últimos LOG_DEDUP_DAYS días usados.
+"""
+import hashlib
+import os
+import struct
+from collections import OrderedDict
+from pathlib import Path
+
+
+LOG_DEDUP_DAYS = int(os.getenv("LOG_DEDUP_DAYS", "2"))
+
+_HEADER = struct.Struct("<Q")
+_HASH_SIZE = 8
+
+
+def _hash(line: str) -> bytes:
+    # errors="replace" igual que append: una línea con surrogates sueltos
+    # se escribe con "?" y su hash es el de lo que quedó en el archivo
+    return hashlib.blake2b(line.encode(errors="replace"), digest_size=_HASH_SIZE).digest()
+
+
+class DayIndex:
+    def __init__(self, log_file: Path):
+        self.log_file = log_file
+        self.idx_file = log_file.with_name(log_file.name + ".idx")
+        self.hashes: set[bytes] = set()
+        self.offset = 0
+        self._load()
+
+    def _load(self):
+        size = self.log_file.stat().st_size if self.log_file.exists() else 0
+        try:
+            raw = self.idx_file.read_bytes()
+        except FileNotFoundError:
+            raw = b""
+        if len(raw) >= _HEADER.size:
+            (offset,) = _HEADER.unpack_from(raw)
+            if offset <= size:
+                self.offset = offset
+                end = _HEADER.size + (len(raw) - _HEADER.size) // _HASH_SIZE * _HASH_SIZE
+                self.hashes = {raw[i:i + _HASH_SIZE] for i in range(_HEADER.size, end, _HASH_SIZE)}
+                if end != len(raw):
+                    # Hash a medio escribir: se descarta
+                    self._rewrite()
+            else:
+                self._rewrite()
+        else:
+            self._rewrite()
+        if size > self.offset:
+            self._catch_up()
+
+    def _rewrite(self):
+        self.hashes.clear()
+        self.offset = 0
+        self.idx_file.parent.mkdir(parents=True, exist_ok=True)
+        self.idx_file.write_bytes(_HEADER.pack(0))
+
+    def _catch_up(self):
+        """Indexa las líneas del .log que el sidecar todavía no tiene."""
+        with open(self.log_file, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # Una última línea sin "\n" queda para la próxima vuelta
+        complete = data[:data.rfind(b"\n") + 1]
+        new = [_hash(line) for line in complete.decode(errors="replace").splitlines()]
+        self.hashes.update(new)
+        self._commit(new, self.offset + len(complete))
+
+    def _commit(self, new: list[bytes], offset: int):
+        with open(self.idx_file, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            f.write(b"".join(new))
+            f.seek(0)
+            f.write(_HEADER.pack(offset))
+        self.offset = offset
+
+    def filter_new(self, lines: list[str], seen: set[bytes] | None = None) -> list[str]:
+        """
+        Líneas que no están en el archivo (ni repetidas dentro del batch).
+        Los hashes entran al índice recién en append: si el write falla, el
+        reintento no se descarta como duplicado. `seen` junta los hashes de
+        varios filter_new de un mismo write.
+        """
+        seen = set() if seen is None else seen
+        new = []
+        for line in lines:
+            h = _hash(line)
+            if h not in self.hashes and h not in seen:
+                seen.add(h)
+                new.append(line)
+        return new
+
+    def append(self, lines: list[str]) -> int:
+        """Escribe `lines` al .log y después sus hashes al sidecar. Devuelve los bytes escritos."""
+        if not lines:
+            return 0
+        data = "".join(line + "\n" for line in lines).encode(errors="replace")
+        with open(self.log_file, "ab") as f:
+            f.write(data)
+            offset = f.tell()
+        hashes = [_hash(line) for line in lines]
+        self.hashes.update(hashes)
+        self._commit(hashes, offset)
+        return len(data)
+
+
+_days: "OrderedDict[Path, DayIndex]" = OrderedDict()
+
+
+def get_index(log_file: Path) -> DayIndex:
+    index = _days.get(log_file)
+    if index is None:
+        index = _days[log_file] = DayIndex(log_file)
+        while len(_days) > LOG_DEDUP_DAYS:
+            _days.popitem(last=False)
+    else:
+        _days.move_to_end(log_file)
+    return index
@@ -0,0 +1,154 @@
+# log_ingest.py
+"""
+Ingesta de logs por lotes (POST /api/logs/bulk).
+
+El cuerpo es NDJSON, opcionalmente comprimido (Content-Encoding: gzip o
+deflate), una línea de log por registro:
+
+    {"seq": 1041, "line": "06:00:00 - Regando zona zona1 (pin 19) de 360 a 375"}
+    {"seq": 1042, "line": "06:00:05 - RUNNING riego_scheduler_loop"}
+
+`seq` lo numera el dispositivo y sube siempre. Por dispositivo se guarda
+la marca de agua (el mayor seq ya escrito a disco): al reintentar un
+lote se descartan exactamente los registros con seq <= marca, sin mirar
+el contenido. Dos líneas iguales con distinto seq se escriben las dos.
+
+Las marcas viven en LOGS_ROOT/ingest_hwm.json y se actualizan recién
+después del fsync del lote (si se corta antes, el reintento lo vuelve a
+escribir entero). Si el writer falla el lote responde 500 sin mover la
+marca. Si no termina en LOG_BULK_TIMEOUT_S responde 503 pero la
+escritura sigue: la marca avanza cuando termina, y el reintento del
+dispositivo la espera antes de mirar la marca (así no escribe dos veces
+lo que ya estaba en la cola del writer).
+"""
+import asyncio
+import json
+import os
+import zlib
+
+from . import log_archive
+
+
+LOG_BULK_MAX_BYTES = int(os.getenv("LOG_BULK_MAX_BYTES", str(8 << 20)))
+# Tope de espera al writer (write + fsync) con el lock del dispositivo tomado
+LOG_BULK_TIMEOUT_S = float(os.getenv("LOG_BULK_TIMEOUT_S", "30"))
+HWM_FILE = log_archive.LOGS_ROOT / "ingest_hwm.json"
+
+
+class BulkError(ValueError):
+    pass
+
+
+def decode_body(body: bytes, encoding: str | None) -> bytes:
+    """Descomprime gzip/deflate con tope de tamaño (nada de zip bombs)."""
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        data = body
+    elif encoding in ("gzip", "deflate"):
+        # deflate: zlib (RFC 1950) o deflate crudo, según el cliente
+        wbits = 31 if encoding == "gzip" else (15 if body[:1] == b"\x78" else -15)
+        d = zlib.decompressobj(wbits)
+        try:
+            data = d.decompress(body, LOG_BULK_MAX_BYTES + 1)
+        except zlib.error as e:
+            raise BulkError(f"Cuerpo {encoding} inválido: {e}")
+    else:
+        raise BulkError(f"Content-Encoding no soportado: {encoding}")
+    if len(data) > LOG_BULK_MAX_BYTES:
+        raise BulkError(f"Lote de más de {LOG_BULK_MAX_BYTES} bytes descomprimido")
+    return data
+
+
+def parse_records(data: bytes) -> list[tuple[int, str]]:
+    """(seq, línea) de cada registro NDJSON, ordenados por seq."""
+    records = []
+    for n, raw in enumerate(data.splitlines(), 1):
+        if not raw.strip():
+            continue
+        try:
+            rec = json.loads(raw)
+            seq, line = int(rec["seq"]), str(rec["line"])
+        except (ValueError, KeyError, TypeError) as e:
+            raise BulkError(f"Registro {n} inválido: {e}")
+        records.append((seq, line))
+    records.sort(key=lambda r: r[0])
+    return records
+
+
+class HighWaterMarks:
+    def __init__(self, path=HWM_FILE):
+        self.path = path
+        self._marks: dict[str, int] | None = None
+        self._locks: dict[str, asyncio.Lock] = {}
+        self._pending: dict[str, asyncio.Task] = {}
+
+    def _load(self) -> dict[str, int]:
+        if self._marks is None:
+            try:
+                self._marks = json.loads(self.path.read_text())
+            except (OSError, ValueError):
+                self._marks = {}
+        return self._marks
+
+    def get(self, device: str) -> int:
+        return self._load().get(device, 0)
+
+    def lock(self, device: str) -> asyncio.Lock:
+        """Un lote por dispositivo a la vez: un reintento espera al original."""
+        lock = self._locks.get(device)
+        if lock is None:
+            lock = self._locks[device] = asyncio.Lock()
+        return lock
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self._marks, f)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp.replace(self.path)
+
+    async def advance(self, device: str, seq: int):
+        marks = self._load()
+        if seq > marks.get(device, 0):
+            marks[device] = seq
+            await asyncio.to_thread(self._save)
+
+    def write(self, device: str, seq: int, submit) -> asyncio.Task:
+        """
+        Corre `submit` (la escritura durable del lote) y después avanza la
+        marca hasta `seq`, en una tarea aparte: si quien la espera se cansa
+        (timeout, cliente que corta) la escritura igual termina y la marca
+        queda bien.
+        """
+        async def run():
+            await submit
+            await self.advance(device, seq)
+
+        task = asyncio.ensure_future(run())
+        self._pending[device] = task
+
+        def done(t):
+            if self._pending.get(device) is t:
+                del self._pending[device]
+            if not t.cancelled():
+                t.exception()  # ya la vio (o la ignora) quien esperaba
+
+        task.add_done_callback(done)
+        return task
+
+    async def settle(self, device: str, timeout: float):
+        """Espera la escritura anterior del dispositivo si quedó en curso; TimeoutError si no termina."""
+        task = self._pending.get(device)
+        if task is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            raise
+        except Exception:
+            pass  # falló: la marca no se movió y este lote la reescribe
+
+
+marks = HighWaterMarks()
@@ -0,0 +1,128 @@
+# log_rotate.py
+"""
+Rotación de los días cerrados del archivo de logs.
+
+Cada LOG_ROTATE_INTERVAL_S segundos, los LOGS_ROOT/YYYY/MM/DD.log con
+LOG_ROTATE_AFTER_DAYS días o más de antigüedad (y sin escrituras en los
+últimos minutos) se pasan a DD.log.gz en bloques gzip independientes:
+el archivo se puede leer entero con zcat, y log_archive lo lee por
+bloques usando el índice DD.log.gz.bix. Los logs del ESP son muy
+repetitivos, así que el .gz queda varias veces más chico.
+
+El .tix (índice de tiempo) se arma antes de comprimir y sigue valiendo:
+los offsets son los del texto sin comprimir. El .idx de dedup se borra,
+a un día cerrado no se le escribe más.
+
+Uso manual:
+    python -m app.log_rotate
+"""
+import asyncio
+import gzip
+import json
+import os
+import time
+from datetime import date, timedelta
+
+from . import log_archive
+
+
+LOG_ROTATE_ENABLED = os.getenv("LOG_ROTATE_ENABLED", "1") == "1"
+LOG_ROTATE_AFTER_DAYS = int(os.getenv("LOG_ROTATE_AFTER_DAYS", "1"))
+LOG_ROTATE_INTERVAL_S = float(os.getenv("LOG_ROTATE_INTERVAL_S", "3600"))
+LOG_BLOCK_SIZE = int(os.getenv("LOG_BLOCK_SIZE", str(64 * 1024)))
+
+# Un .log modificado hace menos que esto todavía puede estar recibiendo líneas
+_QUIET_S = 600
+
+
+def pending_days(today: date | None = None) -> list[date]:
+    """Días con .log sin comprimir que ya se pueden rotar."""
+    limit = (today or date.today()) - timedelta(days=LOG_ROTATE_AFTER_DAYS)
+    days = []
+    for path in log_archive.LOGS_ROOT.glob("[0-9][0-9][0-9][0-9]/[0-9][0-9]/[0-9][0-9].log"):
+        day = log_archive.day_of(path)
+        if day is not None and day <= limit and time.time() - path.stat().st_mtime > _QUIET_S:
+            days.append(day)
+    return sorted(days)
+
+
+def rotate_day(day: date) -> tuple[int, int]:
+    """Comprime DD.log a DD.log.gz + .bix. Devuelve (bytes antes, bytes después)."""
+    plain = log_archive.day_path(day)
+    packed = log_archive.block_path(day)
+
+    # Índice de tiempo al día antes de que desaparezca el .log
+    with log_archive.PlainDay(plain) as reader:
+        log_archive.time_index(plain, reader)
+
+    data = plain.read_bytes()
+    blocks, out, pos = [], bytearray(), 0
+    while pos < len(data):
+        nl = data.find(b"\n", pos + LOG_BLOCK_SIZE - 1)
+        end = len(data) if nl < 0 else nl + 1
+        member = gzip.compress(data[pos:end], compresslevel=9, mtime=0)
+        blocks.append([pos, len(out), len(member)])
+        out += member
+        pos = end
+
+    # Primero el índice, después el .gz y recién al final se borra el .log:
+    # si se corta a la mitad, el .log sigue ahí y open_day lo prefiere
+    bix = packed.with_name(packed.name + ".bix")
+    tmp = bix.with_name(bix.name + ".tmp")
+    tmp.write_text(json.dumps({"size": len(data), "block_size": LOG_BLOCK_SIZE, "blocks": blocks}))
+    tmp.replace(bix)
+    tmp = packed.with_name(packed.name + ".tmp")
+    tmp.write_bytes(out)
+    tmp.replace(packed)
+    plain.unlink()
+    plain.with_name(plain.name + ".idx").unlink(missing_ok=True)
+    return len(data), len(out)
+
+
+def rotate_all(today: date | None = None) -> dict:
+    rotated = {}
+    for day in pending_days(today):
+        try:
+            before, after = rotate_day(day)
+        except OSError as e:
+            print(f"ERROR rotando {day}: {e}")
+            continue
+        rotated[day.isoformat()] = {"bytes": before, "compressed": after}
+        print(f"Log {day} rotado: {before} -> {after} bytes")
+    return rotated
+
+
+# ---------- Tarea de fondo ----------
+
+
+_task: asyncio.Task | None = None
+
+
+async def _run():
+    while True:
+        try:
+            await asyncio.to_thread(rotate_all)
+        except Exception as e:
+            print(f"ERROR en la rotación de logs: {e}")
+        await asyncio.sleep(LOG_ROTATE_INTERVAL_S)
+
+
+async def start():
+    global _task
+    if LOG_ROTATE_ENABLED and _task is None:
+        _task = asyncio.create_task(_run())
+
+
+async def stop():
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass
+        _task = None
+
+
+if __name__ == "__main__":
+    print(json.dumps(rotate_all(), indent=2))
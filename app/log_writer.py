@@ -0,0 +1,201 @@
+# log_writer.py
+"""
+Escritor del archivo de logs del día con group commit.
+
+POST /api/logs solo encola las líneas recibidas; una única tarea de
+fondo junta lo que llegó de muchos POST, lo deduplica (log_dedup), lo
+escribe con un solo write por archivo y hace fsync cada LOG_FSYNC_S
+segundos o cada LOG_FSYNC_BYTES bytes, lo que pase primero. Todo el I/O
+de disco corre en un thread: un disco lento no frena al event loop.
+
+Quien necesite saber que las líneas ya están en disco (durable=True)
+espera al próximo fsync; si hay alguien esperando, el fsync se hace
+apenas termina el write del grupo en vez de esperar al intervalo.
+"""
+import asyncio
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from . import events, log_archive, log_dedup, metrics
+from .log_broadcast import broadcaster
+
+
+LOG_WRITER_QUEUE = int(os.getenv("LOG_WRITER_QUEUE", "1000"))
+LOG_WRITER_MAX_BATCH = int(os.getenv("LOG_WRITER_MAX_BATCH", "500"))
+LOG_FSYNC_S = float(os.getenv("LOG_FSYNC_S", "1"))
+LOG_FSYNC_BYTES = int(os.getenv("LOG_FSYNC_BYTES", str(1 << 20)))
+
+metrics.METRICS.update({
+    "log_writer_flush_seconds": ("histogram", "Duración de cada write agrupado al archivo de logs"),
+    "log_writer_fsync_seconds": ("histogram", "Duración de cada fsync del archivo de logs"),
+    "log_writer_lines_total": ("counter", "Líneas procesadas por el writer (antes de deduplicar)"),
+})
+
+
+def _fsync(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class LogWriter:
+    def __init__(self):
+        self.queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._dirty: set[Path] = set()
+        self._dirty_bytes = 0
+        self._last_sync = time.monotonic()
+        self._waiters: list[asyncio.Future] = []
+
+    async def submit(self, log_file: Path, lines: list[str], durable: bool = False, dedup: bool = True):
+        """
+        Encola `lines`; con durable=True vuelve recién después del fsync.
+        Con dedup=False se escriben todas, aunque ya estén en el archivo
+        (quien llama ya sabe que son nuevas, ej. /logs/bulk con su seq).
+        """
+        if self._task is None:
+            self.start()
+        done = asyncio.get_running_loop().create_future() if durable else None
+        await self.queue.put((log_file, lines, done, dedup))
+        if done is not None:
+            await done
+
+    def start(self):
+        if self._task is None:
+            self.queue = asyncio.Queue(maxsize=LOG_WRITER_QUEUE)
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Escribe lo que quede en la cola, hace fsync y termina."""
+        if self._task is None:
+            return
+        await self.queue.put(None)
+        await self._task
+        self._task = None
+
+    def _drain(self, first) -> tuple[list, bool]:
+        items, closing = [first], False
+        while len(items) < LOG_WRITER_MAX_BATCH and not self.queue.empty():
+            item = self.queue.get_nowait()
+            if item is None:
+                closing = True
+                break
+            items.append(item)
+        return items, closing
+
+    async def run(self):
+        while True:
+            timeout = None
+            if self._dirty:
+                timeout = max(0.0, LOG_FSYNC_S - (time.monotonic() - self._last_sync))
+            try:
+                first = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                await self._sync()
+                continue
+            if first is None:
+                await self._sync()
+                return
+            items, closing = self._drain(first)
+            await self._process(items)
+            if closing:
+                await self._sync()
+                return
+            if (self._waiters or self._dirty_bytes >= LOG_FSYNC_BYTES
+                    or time.monotonic() - self._last_sync >= LOG_FSYNC_S):
+                await self._sync()
+
+    async def _process(self, items: list):
+        by_file: dict[Path, list[tuple[list[str], bool]]] = {}
+        waiters = []
+        for log_file, lines, done, dedup in items:
+            by_file.setdefault(log_file, []).append((lines, dedup))
+            if done is not None:
+                waiters.append(done)
+        metrics.inc("log_writer_lines_total", value=sum(len(lines) for _, lines, _, _ in items))
+
+        t0 = time.perf_counter()
+        try:
+            written = await asyncio.to_thread(self._write, by_file)
+        except Exception as e:
+            # Cualquier error es de este grupo: se le avisa a quienes esperan
+            # y el writer sigue con el próximo (si la tarea muere, no se
+            # escribe nunca más nada)
+            print(f"ERROR escribiendo logs: {e!r}")
+            self._fail(e, waiters)
+            return
+        self._waiters.extend(waiters)
+        metrics.observe("log_writer_flush_seconds", time.perf_counter() - t0)
+
+        for log_file, new_lines, nbytes in written:
+            self._dirty.add(log_file)
+            self._dirty_bytes += nbytes
+            metrics.inc("logs_written_lines_total", value=len(new_lines))
+            broadcaster.publish(new_lines)
+
+    @staticmethod
+    def _write(by_file: dict) -> list:
+        written = []
+        for log_file, chunks in by_file.items():
+            log_file.parent.mkdir(parents=True, exist_ok=True)
+            index = log_dedup.get_index(log_file)
+            new_lines, seen = [], set()
+            for lines, dedup in chunks:
+                new_lines.extend(index.filter_new(lines, seen) if dedup else lines)
+            written.append((log_file, new_lines, index.append(new_lines)))
+            # Eventos de riego (zona, acción, duración) para consultas rápidas
+            day = log_archive.day_of(log_file)
+            if day is not None:
+                try:
+                    events.store.ingest(day, new_lines)
+                except sqlite3.Error as e:
+                    print(f"ERROR guardando eventos de riego: {e}")
+        return written
+
+    async def _sync(self):
+        dirty, self._dirty = self._dirty, set()
+        waiters, self._waiters = self._waiters, []
+        self._dirty_bytes = 0
+        self._last_sync = time.monotonic()
+        if dirty:
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._fsync_all, dirty)
+            except Exception as e:
+                print(f"ERROR en fsync de logs: {e!r}")
+                self._fail(e, waiters)
+                return
+            metrics.observe("log_writer_fsync_seconds", time.perf_counter() - t0)
+        for done in waiters:
+            if not done.done():
+                done.set_result(None)
+
+    @staticmethod
+    def _fsync_all(paths):
+        for path in paths:
+            _fsync(path)
+            _fsync(path.with_name(path.name + ".idx"))
+
+    def _fail(self, exc: Exception, waiters: list | None = None):
+        if waiters is None:
+            waiters, self._waiters = self._waiters, []
+        for done in waiters:
+            if not done.done():
+                done.set_exception(exc)
+
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+
+writer = LogWriter()
+
+
+def _writer_metrics():
+    return [("log_writer_queue_depth", "gauge", "Batches de logs esperando al writer", {}, writer.depth())]
+
+
+metrics.register_collector(_writer_metrics)
@@ -1,10 +1,18 @@
 # logs_api.py
 from pydantic import BaseModel
-from fastapi import APIRouter, Query, Request
-import requests
-from requests.auth import HTTPBasicAuth
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import os
+import re
+import time
+import httpx
 from datetime import datetime
-from pathlib import Path
+from . import esp_cache, log_archive, log_ingest, log_writer, metrics
+from .log_broadcast import broadcaster
+from .esp_breaker import EspUnavailable
+from .esp_scheduler import QueueFull
 
 router = APIRouter()
 
@@ -15,7 +23,8 @@ class LogPayload(BaseModel):
 
 
 @router.post("/logs")
-async def receive_logs(request: Request):
+async def receive_logs(request: Request,
+                       durable: bool = Query(False, description="Responder recién cuando las líneas estén en disco (fsync)")):
     try:
         payload = await request.json()
     except Exception as e:
@@ -49,83 +58,182 @@ async def receive_logs(request: Request):
     
     if not lines:
         return {"status": "ok", "received_lines": 0}
+    metrics.inc("logs_received_lines_total", value=len(lines))
 
-    # Append lines to date-based log file
-    today = datetime.now().strftime("%Y/%m/%d")
-    log_file = Path(f"{today}.log")
-    log_file.parent.mkdir(parents=True, exist_ok=True)
-
-    # Leer líneas existentes
-    existing_lines = set()
-    if log_file.exists():
-        with open(log_file, "r") as f:
-            existing_lines = set(f.read().splitlines())
-
-    # Escribir solo líneas nuevas
-    with open(log_file, "a") as f:
-        for line in lines:
-            line_str = str(line)
-            if "/tail, filename=log.txt" not in line_str and line_str not in existing_lines:
-                f.write(line_str + "\n")
+    # Append lines to date-based log file: lo escribe el writer de fondo
+    # (dedup + group commit); acá solo se encola
+    kept = [str(line) for line in lines if "/tail, filename=log.txt" not in str(line)]
+    await log_writer.writer.submit(log_archive.day_path(datetime.now()), kept, durable)
 
     return {"status": "ok", "received_lines": len(lines)}
 
 
-# IP del ESP32
-ESP32_IP = "http://192.168.0.50"
-ESP32_USER = "admin"
-ESP32_PASS = "1234"
-
-
-@router.get("/logs/tail")
-async def tail_log(n: int = Query(20, ge=1, le=100)):
+@router.post("/logs/bulk")
+async def receive_logs_bulk(request: Request,
+                            device: str = Query(..., description="Id del dispositivo que manda el lote"),
+                            content_encoding: str | None = Header(None)):
     """
-    Devuelve el resultado del tail de log.txt directamente desde el ESP32.
-    Solo se llama al endpoint del ESP32.
+    Lote NDJSON ({"seq": n, "line": "..."} por renglón), opcionalmente con
+    gzip/deflate. Idempotente por (device, seq): lo que ya se escribió se
+    descarta, lo nuevo se escribe aunque el texto se repita. Responde
+    después del fsync, así la marca de agua que devuelve es segura.
     """
-
     try:
-        # Construimos la URL del ESP32
-        esp_url = f"{ESP32_IP}/tail?filename=log.txt"
-
-        print(esp_url)
-        # Llamada HTTP al ESP32
-        r = requests.get(
-            f"{ESP32_IP}/tail?filename=log.txt",
-            timeout=5,
-            auth=HTTPBasicAuth(ESP32_USER, ESP32_PASS)
-        )
-        r.raise_for_status()
-
-        lines = r.text.splitlines()
+        data = log_ingest.decode_body(await request.body(), content_encoding)
+        records = log_ingest.parse_records(data)
+    except log_ingest.BulkError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    metrics.inc("logs_received_lines_total", value=len(records))
+
+    timeout = log_ingest.LOG_BULK_TIMEOUT_S
+    async with log_ingest.marks.lock(device):
+        try:
+            # Un lote anterior que respondió 503 puede seguir escribiéndose
+            await log_ingest.marks.settle(device, timeout)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="El writer de logs no respondió a tiempo",
+                                headers={"Retry-After": "5"})
+        hwm = log_ingest.marks.get(device)
+        fresh, last, gap = [], hwm, 0
+        for seq, line in records:
+            if seq > last:
+                if not fresh:
+                    gap = seq - hwm - 1  # seqs que nunca llegaron
+                fresh.append(line)
+                last = seq
+        if fresh:
+            write = log_ingest.marks.write(device, last, log_writer.writer.submit(
+                log_archive.day_path(datetime.now()), fresh, durable=True, dedup=False))
+            try:
+                # shield: con timeout la escritura sigue y la marca avanza al terminar
+                await asyncio.wait_for(asyncio.shield(write), timeout)
+            except asyncio.TimeoutError:
+                raise HTTPException(status_code=503, detail="El writer de logs no respondió a tiempo",
+                                    headers={"Retry-After": "5"})
+            except Exception as e:
+                raise HTTPException(status_code=500, detail=f"No se pudo escribir el lote: {e}")
+
+    return {"status": "ok", "device": device, "received": len(records), "accepted": len(fresh),
+            "duplicates": len(records) - len(fresh), "gap": gap, "hwm": last}
+
+
+# Cada cuánto mandar un comentario SSE para que proxies no corten la conexión
+STREAM_KEEPALIVE_S = 15
+
+
+@router.get("/logs/stream")
+async def stream_logs(request: Request, n: int = Query(20, ge=0, le=1000),
+                      last_event_id: str | None = Header(None)):
+    """
+    Server-Sent Events con las líneas nuevas a medida que llegan por POST /logs.
+    Al conectar se mandan las últimas `n` líneas; al reconectar, el navegador
+    manda Last-Event-ID y se reenvía solo lo que se perdió.
+    """
+    # subscribe + replay sin await en el medio: no se pierde ni duplica nada
+    queue = broadcaster.subscribe()
+    backlog = broadcaster.replay(last_event_id, n)
+
+    def _event(event_id, line):
+        data = "\n".join(f"data: {part}" for part in line.split("\n"))
+        return f"id: {event_id}\n{data}\n\n"
+
+    async def events():
+        try:
+            yield "retry: 3000\n\n"
+            for event_id, line in backlog:
+                yield _event(event_id, line)
+            while True:
+                try:
+                    item = await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": ping\n\n"
+                    continue
+                if item is None:
+                    break
+                yield _event(*item)
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/logs/search")
+def search_logs(from_: datetime = Query(..., alias="from", description="Desde (ISO, ej. 2025-01-31T06:00)"),
+                to: datetime | None = Query(None, description="Hasta (ISO); por defecto ahora"),
+                q: str | None = Query(None, description="Texto a buscar"),
+                regex: str | None = Query(None, description="Expresión regular"),
+                zone: list[str] | None = Query(None, description="Zonas (zona1 o 1), se puede repetir"),
+                limit: int = Query(200, ge=1, le=5000),
+                cursor: str | None = Query(None, description="next_cursor de la página anterior")):
+    """
+    Busca en el archivo de logs (YYYY/MM/DD.log) por rango de tiempo y filtros.
+    Devuelve hasta `limit` líneas y `next_cursor` si hay más. La respuesta se
+    va mandando a medida que se encuentran las líneas.
+    """
+    to = to or datetime.now()
+    if to < from_:
+        raise HTTPException(status_code=400, detail="'to' es anterior a 'from'")
+    try:
+        pattern = re.compile(regex) if regex else None
+        if cursor:
+            log_archive.decode_cursor(cursor)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Regex inválida: {e}")
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    zones = log_archive.zone_pattern(zone) if zone else None
 
-        # Append lines to date-based log file
+    # Generador sync: Starlette lo recorre en un thread, el I/O no frena al loop
+    def results():
+        yield '{"results": ['
+        next_cursor, prev = None, None
+        for n, (ts, line, line_cursor) in enumerate(
+                log_archive.search(from_, to, q, pattern, zones, cursor)):
+            if n == limit:
+                next_cursor = prev
+                break
+            sep = ", " if n else ""
+            yield sep + json.dumps({"ts": ts.isoformat(), "line": line}, ensure_ascii=False)
+            prev = line_cursor
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + "}"
 
-        '''
-        today = datetime.now().strftime("%Y/%m/%d")
-        log_file = Path(f"{today}.log")
-        log_file.parent.mkdir(parents=True, exist_ok=True)
+    return StreamingResponse(results(), media_type="application/json")
 
-        # Leer líneas existentes
-        existing_lines = set()
-        if log_file.exists():
-            with open(log_file, "r") as f:
-                existing_lines = set(f.read().splitlines())
 
-        # Escribir solo líneas nuevas
-        with open(log_file, "a") as f:
-            for line in lines:
-                if "/tail, filename=log.txt" not in line and line not in existing_lines:
-                    f.write(line + "\n")
+# Si el archivo local no se escribió en este tiempo, el tail se pide al ESP
+LOG_TAIL_STALE_S = float(os.getenv("LOG_TAIL_STALE_S", "30"))
 
 
-        '''
+@router.get("/logs/tail")
+async def tail_log(n: int = Query(20, ge=1, le=100),
+                   since: str | None = Query(None, description="cursor devuelto por el tail anterior"),
+                   device: str | None = Query(None, description="Id del ESP (devices.json)")):
+    """
+    Últimas líneas del log, leídas del archivo local del día (las mismas que
+    el ESP ya mandó por POST /logs). Con `since` devuelve solo lo nuevo.
+    Solo si el archivo local está desactualizado (el ESP no manda logs hace
+    más de LOG_TAIL_STALE_S) se le pide el tail de log.txt al ESP32; esa
+    respuesta no trae cursor (el cliente vuelve a pedir sin `since`).
+    """
+    try:
+        local = await asyncio.to_thread(log_archive.tail, n, since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
 
-        return {"lines": lines}
+    modified = local.pop("modified")
+    if modified is not None and time.time() - modified <= LOG_TAIL_STALE_S:
+        return {**local, "source": "archive"}
 
-    except requests.exceptions.RequestException as e:
-        # Error de conexión o timeout
-        return {"lines": [], "error": f"No se pudo conectar al ESP32: {e}"}
-    except ValueError:
-        # JSON malformado
-        return {"lines": [], "error": "Respuesta inválida del ESP32"}
+    try:
+        # n va en los params: también es parte de la clave del cache
+        r = await esp_cache.cached_get("/tail", {"filename": "log.txt", "n": n}, device)
+        r.raise_for_status()
+        # Lo del ESP no tiene cursor: no sirve para seguir con `since`
+        return {"lines": r.text.splitlines()[-n:], "source": "esp"}
+    except (httpx.HTTPError, EspUnavailable, QueueFull) as e:
+        # Error de conexión o timeout: lo que haya en el archivo local
+        return {**local, "source": "archive", "stale": True,
+                "error": f"No se pudo conectar al ESP32: {e}"}
@@ -1,69 +1,120 @@
-import os
-from urllib.parse import urlencode
+import json
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import httpx
 from fastapi import FastAPI, Query, Body, Request, UploadFile
+from pydantic import BaseModel
 from .logs_api import router as logs_router
-from .wheater import weather_router
+from .wheater import weather_router, weather_cache
+from .fleet import fleet_router
+from .esp_mirror import mirror_router
+from .events import events_router
+from . import devices, esp_client, esp_cache, esp_scheduler, esp_breaker, esp_mirror, log_rotate, log_writer, metrics
+from .log_broadcast import broadcaster
+from .devices import UnknownDevice
+from .esp_breaker import EspUnavailable
+from .esp_scheduler import QueueFull
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Un cliente keep-alive por ESP durante toda la vida de la app
+    await esp_client.start()
+    # Espejo del estado de los ESP en segundo plano
+    await esp_mirror.start()
+    # Con METRICS_DIR (varios workers) cada proceso vuelca sus métricas;
+    # antes se adoptan los archivos que dejaron procesos anteriores
+    metrics.adopt_stale(startup=True)
+    flusher = asyncio.create_task(metrics.flush_loop()) if metrics.METRICS_DIR else None
+    # Escritor del log del día (group commit)
+    log_writer.writer.start()
+    # Compresión de los días de log ya cerrados
+    await log_rotate.start()
+    # Pronóstico del clima renovado en segundo plano
+    weather_cache.start()
+    try:
+        yield
+    finally:
+        if flusher is not None:
+            flusher.cancel()
+        await weather_cache.stop()
+        await log_rotate.stop()
+        await log_writer.writer.stop()
+        await esp_mirror.stop()
+        await esp_client.stop()
+
+
+app = FastAPI(title="Riego UI + ESP Proxy", lifespan=lifespan)
+app.add_middleware(metrics.MetricsMiddleware)
+app.include_router(logs_router, prefix="/api")  # <- esto pone /api/logs/tail
+app.include_router(weather_router, prefix="/api")
+app.include_router(fleet_router, prefix="/api")
+app.include_router(mirror_router, prefix="/api")
+app.include_router(events_router, prefix="/api")
 
 
-# === Config del ESP (igual que antes) ===
-ESP_HOST = os.getenv("ESP_HOST", "http://192.168.0.50")
-ESP_USER = os.getenv("ESP_USER", "admin")
-ESP_PASS = os.getenv("ESP_PASS", "1234")
-ESP_TIMEOUT = float(os.getenv("ESP_TIMEOUT", "5"))
+@app.exception_handler(UnknownDevice)
+async def _unknown_device(request: Request, exc: UnknownDevice):
+    return JSONResponse(status_code=404, content={"error": str(exc)})
 
-app = FastAPI(title="Riego UI + ESP Proxy")
-app.include_router(logs_router, prefix="/api")  # <- esto pone /api/logs/tail
-app.include_router(weather_router, prefix="/api")
+
+@app.exception_handler(QueueFull)
+async def _queue_full(request: Request, exc: QueueFull):
+    # Backpressure: la cola del ESP está llena, que el cliente reintente luego
+    return JSONResponse(status_code=429, content={"error": str(exc), "retry_after": exc.retry_after},
+                        headers={"Retry-After": str(exc.retry_after)})
+
+
+@app.exception_handler(EspUnavailable)
+async def _esp_unavailable(request: Request, exc: EspUnavailable):
+    # Circuito abierto: respondemos al instante en vez de esperar el timeout
+    return JSONResponse(status_code=503, content={"error": str(exc), "last_error": exc.last_error,
+                                                  "retry_after": exc.retry_after},
+                        headers={"Retry-After": str(exc.retry_after)})
 
 # ---------- helpers ----------
 
 
-async def _esp_get(path: str, params: dict | None = None):
-    url = f"{ESP_HOST}{path}"
-    if params:
-        url += f"?{urlencode(params)}"
-    auth = httpx.BasicAuth(ESP_USER, ESP_PASS)
-    async with httpx.AsyncClient(timeout=ESP_TIMEOUT) as client:
-        r = await client.get(url, auth=auth)
-    return r
+async def _esp_get(path: str, params: dict | None = None, device: str | None = None):
+    # Usa el cliente compartido (pool keep-alive + timeout por ruta)
+    return await esp_client.esp_get(path, params, device)
 
 
-async def _esp_post(path: str, params: dict | None = None, data: str = ""):
-    url = f"{ESP_HOST}{path}"
-    if params:
-        url += f"?{urlencode(params)}"
-    auth = httpx.BasicAuth(ESP_USER, ESP_PASS)
+async def _esp_post(path: str, params: dict | None = None, data: str = "", device: str | None = None):
     # El firmware que compartiste lee el body como texto (no JSON)
-    headers = {"Content-Type": "text/plain; charset=utf-8"}
-    async with httpx.AsyncClient(timeout=ESP_TIMEOUT) as client:
-        r = await client.post(url, auth=auth, content=data.encode("utf-8"), headers=headers)
-    return r
+    return await esp_client.esp_post(path, params, data, device)
+
+
+async def _esp_get_cached(path: str, params: dict | None = None, device: str | None = None):
+    # Lecturas: coalescing de pedidos idénticos + cache TTL corto
+    return await esp_cache.cached_get(path, params, device)
 
 
 def _as_response(r: httpx.Response):
     # Tu firmware devuelve JSON en todas las rutas -> lo pasamos tal cual
     ctype = r.headers.get("content-type", "")
+    # Si vino del cache con el ESP caído, se lo avisamos al cliente
+    headers = {esp_cache.STALE_HEADER: "1"} if esp_cache.STALE_HEADER in r.headers else None
     if "application/json" in ctype:
         try:
-            return JSONResponse(status_code=r.status_code, content=r.json())
+            return JSONResponse(status_code=r.status_code, content=r.json(), headers=headers)
         except Exception:
-            return PlainTextResponse(status_code=r.status_code, content=r.text)
-    return PlainTextResponse(status_code=r.status_code, content=r.text)
+            return PlainTextResponse(status_code=r.status_code, content=r.text, headers=headers)
+    return PlainTextResponse(status_code=r.status_code, content=r.text, headers=headers)
 
 # ---------- API del ESP: endpoints específicos ----------
 
 
 @app.get("/api/esp/ls")
-async def esp_ls():
+async def esp_ls(device: str | None = Query(None, description="Id del ESP (devices.json)")):
     """
     GET {ESP_HOST}/ls
     Devuelve {"files": [...]} según tu firmware.
     """
     try:
-        r = await _esp_get("/ls")
+        r = await _esp_get_cached("/ls", device=device)
         return _as_response(r)
     except httpx.TimeoutException:
         return JSONResponse(status_code=504, content={"error": "timeout"})
@@ -72,13 +123,14 @@ async def esp_ls():
 
 
 @app.get("/api/esp/cat")
-async def esp_cat(file: str = Query(..., description="Nombre de archivo")):
+async def esp_cat(file: str = Query(..., description="Nombre de archivo"),
+                  device: str | None = Query(None, description="Id del ESP (devices.json)")):
     """
     GET {ESP_HOST}/cat?file=<nombre>
     Devuelve {"file": "...", "content": "..."} o error JSON.
     """
     try:
-        r = await _esp_get("/cat", {"file": file})
+        r = await _esp_get_cached("/cat", {"file": file}, device)
         return _as_response(r)
     except httpx.TimeoutException:
         return JSONResponse(status_code=504, content={"error": "timeout"})
@@ -97,7 +149,8 @@ async def upload_file(data: UploadFile):
 
 
 @app.post("/api/esp/rm")
-async def esp_rm(file: str = Query(..., description="Nombre de archivo a eliminar")):
+async def esp_rm(file: str = Query(..., description="Nombre de archivo a eliminar"),
+                 device: str | None = Query(None, description="Id del ESP (devices.json)")):
     """
     Tu firmware acepta /rm (sin restricción de método).
     Usamos POST desde la API para acciones destructivas.
@@ -105,7 +158,9 @@ async def esp_rm(file: str = Query(..., description="Nombre de archivo a elimina
     """
     try:
         # podríamos usar GET directo porque tu firmware lo maneja así
-        r = await _esp_get("/rm", {"file": file})
+        r = await _esp_get("/rm", {"file": file}, device)
+        esp_cache.invalidate_file(file, device)
+        esp_mirror.nudge(device)
         return _as_response(r)
     except httpx.TimeoutException:
         return JSONResponse(status_code=504, content={"error": "timeout"})
@@ -118,15 +173,25 @@ async def esp_exec(
     request: Request,
     cmd: str = Query(..., description="Comando para el ESP32"),
     filename: str | None = Query(None, description="Nombre de archivo"),
+    device: str | None = Query(None, description="Id del ESP (devices.json)"),
     body: str = Body("", media_type="text/plain")
 ):
     try:
         if request.method == "GET":
             # Ej: /api/esp?cmd=ls
-            r = await _esp_get(f"/{cmd}", {"file": filename} if filename else None)
+            params = {"file": filename} if filename else None
+            if f"/{cmd}" in esp_cache.ESP_CACHE_TTLS:
+                r = await _esp_get_cached(f"/{cmd}", params, device)
+            else:
+                r = await _esp_get(f"/{cmd}", params, device)
+                if cmd == "rm":
+                    esp_cache.invalidate_file(filename, device)
+                    esp_mirror.nudge(device)
         else:
             # Ej: /api/esp?cmd=upload&filename=main.py
-            r = await _esp_post(f"/{cmd}", {"filename": filename} if filename else None, data=body)
+            r = await _esp_post(f"/{cmd}", {"filename": filename} if filename else None, data=body, device=device)
+            esp_cache.invalidate_file(filename, device)
+            esp_mirror.nudge(device)
 
         return _as_response(r)
 
@@ -140,7 +205,8 @@ async def esp_exec(
 @app.post("/api/esp/zone")
 async def esp_zone(request: Request, body: str = Body("", media_type="text/plain"),
                    zone: str | None = Query(None), action: str | None = Query(None),
-                   duration: int | None = Query(None)):
+                   duration: int | None = Query(None),
+                   device: str | None = Query(None, description="Id del ESP (devices.json)")):
     """
     Proxy para encender/apagar zonas del ESP.
     Formatos aceptados:
@@ -181,7 +247,45 @@ async def esp_zone(request: Request, body: str = Body("", media_type="text/plain
 
     try:
         # Usamos GET porque el firmware acepta GET para /zone (como otros endpoints)
-        r = await _esp_get("/zone", params)
+        r = await _esp_get("/zone", params, device)
+        # El firmware loguea cada comando: los tails cacheados quedaron viejos
+        esp_cache.invalidate("/tail", device=device)
+        esp_mirror.nudge(device)
+        return _as_response(r)
+    except httpx.TimeoutException:
+        return JSONResponse(status_code=504, content={"error": "timeout"})
+    except httpx.RequestError as e:
+        return JSONResponse(status_code=502, content={"error": str(e)})
+
+
+class ZoneOp(BaseModel):
+    zone: str
+    action: str = "on"
+    duration: int | None = None
+
+
+class ZoneBatch(BaseModel):
+    ops: list[ZoneOp]
+
+
+@app.post("/api/esp/batch")
+async def esp_batch(batch: ZoneBatch,
+                    device: str | None = Query(None, description="Id del ESP (devices.json)")):
+    """
+    Varias operaciones de zona en un solo viaje al ESP:
+      {"ops": [{"zone": "zona1", "action": "on", "duration": 300},
+               {"zone": "3", "action": "off"}]}
+
+    Reenvía a POST {ESP_HOST}/batch; el firmware valida todas y las aplica
+    juntas (si una es inválida no aplica ninguna) y devuelve un resultado único.
+    """
+    if not batch.ops:
+        return JSONResponse(status_code=400, content={"error": "ops vacío"})
+    data = json.dumps({"ops": [op.model_dump(exclude_none=True) for op in batch.ops]})
+    try:
+        r = await _esp_post("/batch", data=data, device=device)
+        esp_cache.invalidate("/tail", device=device)
+        esp_mirror.nudge(device)
         return _as_response(r)
     except httpx.TimeoutException:
         return JSONResponse(status_code=504, content={"error": "timeout"})
@@ -190,7 +294,8 @@ async def esp_zone(request: Request, body: str = Body("", media_type="text/plain
 
 
 @app.get("/api/esp/execute")
-async def esp_execute(code: str = Query(..., description="Código Python a ejecutar en ESP32")):
+async def esp_execute(code: str = Query(..., description="Código Python a ejecutar en ESP32"),
+                      device: str | None = Query(None, description="Id del ESP (devices.json)")):
     """
     Ejecuta código Python en el ESP32.
     
@@ -201,13 +306,59 @@ async def esp_execute(code: str = Query(..., description="Código Python a ejecu
     Retorna: {"result": "salida", "error": null}
     """
     try:
-        r = await _esp_get("/execute", {"code": code})
+        r = await _esp_get("/execute", {"code": code}, device)
         return _as_response(r)
     except httpx.TimeoutException:
         return JSONResponse(status_code=504, content={"error": "timeout"})
     except httpx.RequestError as e:
         return JSONResponse(status_code=502, content={"error": str(e)})
 
+
+@app.get("/api/esp/queue")
+async def esp_queue():
+    """Profundidad de cada carril, pedidos en vuelo y tiempos de espera por ESP."""
+    return esp_scheduler.snapshot([dev.id for dev in devices.all_devices()])
+
+
+@app.get("/api/esp/health")
+async def esp_health():
+    """Estado del circuit breaker de cada ESP (closed/open/half_open)."""
+    return esp_breaker.snapshot([dev.id for dev in devices.all_devices()])
+
+
+@app.get("/api/esp/devices")
+async def esp_devices():
+    """Dispositivos registrados (sin credenciales)."""
+    return {
+        "default": devices.default_id(),
+        "devices": [{"id": d.id, "name": d.name, "host": d.host, "zones": d.zones}
+                    for d in devices.all_devices()],
+    }
+
+def _esp_state_metrics():
+    # Estado de colas y breakers de este worker, leído en cada scrape
+    samples = []
+    ids = [dev.id for dev in devices.all_devices()]
+    for device, snap in esp_scheduler.snapshot(ids).items():
+        for lane, info in snap["lanes"].items():
+            samples.append(("esp_queue_depth", "gauge", "Pedidos esperando en la cola del ESP",
+                            {"device": device, "lane": lane}, info["depth"]))
+    for device, snap in esp_breaker.snapshot(ids).items():
+        samples.append(("esp_breaker_open", "gauge", "1 si el circuit breaker del ESP no está cerrado",
+                        {"device": device, "state": snap["state"]}, int(snap["state"] != esp_breaker.CLOSED)))
+    samples.append(("logs_stream_viewers", "gauge", "Viewers conectados al stream de logs", {},
+                    broadcaster.viewers))
+    return samples
+
+
+metrics.register_collector(_esp_state_metrics)
+
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Métricas en formato texto de Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # ---------- Frontend ----------
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -0,0 +1,271 @@
+# metrics.py
+"""
+Métricas del proxy en formato texto de Prometheus (GET /metrics).
+
+Contadores, gauges e histogramas viven en dicts del proceso: registrar
+una muestra es sumar en un dict, sin locks (todo corre en el event loop).
+
+Con varios workers de uvicorn cada proceso tiene sus propios números.
+Si se define METRICS_DIR, cada worker vuelca los suyos a
+METRICS_DIR/metrics-<pid>.json cada METRICS_FLUSH_S segundos, y el worker
+que atiende el scrape suma los de todos. El archivo de un proceso que ya
+no existe (o el de una corrida anterior con el mismo pid) se borra: sus
+contadores e histogramas los adopta el worker que lo encuentra, sus
+gauges se descartan. Así el directorio no crece con cada reinicio.
+"""
+import asyncio
+import bisect
+import json
+import os
+import time
+from pathlib import Path
+
+
+METRICS_DIR = os.getenv("METRICS_DIR")
+METRICS_FLUSH_S = float(os.getenv("METRICS_FLUSH_S", "5"))
+
+# Buckets de latencia (segundos): la WiFi del ESP va de decenas de ms a varios s
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# nombre -> (tipo, ayuda)
+METRICS = {
+    "http_requests_total": ("counter", "Requests atendidos por el proxy"),
+    "http_request_duration_seconds": ("histogram", "Latencia de los requests del proxy por ruta"),
+    "http_requests_in_flight": ("gauge", "Requests del proxy en curso"),
+    "esp_upstream_responses_total": ("counter", "Respuestas del ESP por ruta y status"),
+    "esp_upstream_duration_seconds": ("histogram", "Latencia de las llamadas al ESP (sin contar la espera en la cola)"),
+    "esp_upstream_timeouts_total": ("counter", "Llamadas al ESP que dieron timeout"),
+    "esp_upstream_connect_errors_total": ("counter", "Llamadas al ESP con error de conexión"),
+    "esp_upstream_in_flight": ("gauge", "Llamadas al ESP en curso"),
+    "esp_upstream_wire_bytes_total": ("counter", "Bytes recibidos del ESP tal como viajaron (comprimidos)"),
+    "esp_upstream_body_bytes_total": ("counter", "Bytes de las respuestas del ESP ya descomprimidas"),
+    "weather_fetch_duration_seconds": ("histogram", "Latencia de las consultas a open-meteo"),
+    "weather_fetch_errors_total": ("counter", "Consultas a open-meteo fallidas"),
+    "logs_received_lines_total": ("counter", "Líneas recibidas en POST /api/logs"),
+    "logs_written_lines_total": ("counter", "Líneas nuevas escritas al archivo del día"),
+}
+
+_counters: dict = {}
+_gauges: dict = {}
+_histograms: dict = {}  # key -> [counts por bucket..., +Inf], sum
+_collectors: list = []
+
+
+def _key(name: str, labels: dict | None):
+    return name, tuple(sorted(labels.items())) if labels else ()
+
+
+def inc(name: str, labels: dict | None = None, value: float = 1):
+    key = _key(name, labels)
+    _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge_add(name: str, delta: float, labels: dict | None = None):
+    key = _key(name, labels)
+    _gauges[key] = _gauges.get(key, 0) + delta
+
+
+def observe(name: str, value: float, labels: dict | None = None):
+    key = _key(name, labels)
+    hist = _histograms.get(key)
+    if hist is None:
+        hist = _histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0]
+    # bisect_left: value <= bound cae en ese bucket; más allá del último, +Inf
+    hist[0][bisect.bisect_left(BUCKETS, value)] += 1
+    hist[1] += value
+
+
+def register_collector(fn):
+    """`fn()` devuelve [(nombre, tipo, ayuda, labels, valor)]; se evalúa en cada scrape."""
+    _collectors.append(fn)
+
+
+# ---------- Middleware ASGI ----------
+
+
+def _route_template(scope) -> str:
+    # Con include_router(prefix=...) las versiones nuevas de FastAPI dejan en
+    # scope["route"] la ruta sin el prefijo; el path completo está en el contexto
+    ctx = scope.get("fastapi", {}).get("effective_route_context")
+    if ctx is not None:
+        return ctx.path
+    return getattr(scope.get("route"), "path", "unmatched")
+
+
+class MetricsMiddleware:
+    """Latencia, status e in-flight por ruta (usa el template, ej. /api/state/{section})."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        gauge_add("http_requests_in_flight", 1)
+        t0 = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            elapsed = time.perf_counter() - t0
+            gauge_add("http_requests_in_flight", -1)
+            path = _route_template(scope)
+            method = scope["method"]
+            inc("http_requests_total", {"method": method, "route": path, "status": str(status[0])})
+            observe("http_request_duration_seconds", elapsed, {"method": method, "route": path})
+
+
+# ---------- Multi-worker ----------
+
+
+def _dump() -> dict:
+    return {
+        "counters": [[n, list(l), v] for (n, l), v in _counters.items()],
+        "gauges": [[n, list(l), v] for (n, l), v in _gauges.items()],
+        "histograms": [[n, list(l), h[0], h[1]] for (n, l), h in _histograms.items()],
+    }
+
+
+def flush():
+    if not METRICS_DIR:
+        return
+    directory = Path(METRICS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    tmp = directory / f".metrics-{os.getpid()}.tmp"
+    tmp.write_text(json.dumps(_dump()))
+    tmp.replace(directory / f"metrics-{os.getpid()}.json")
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _pid_files():
+    for path in Path(METRICS_DIR).glob("metrics-*.json"):
+        try:
+            yield path, int(path.stem.split("-", 1)[1])
+        except ValueError:
+            continue
+
+
+def _fold(data: dict, counters: dict, gauges: dict | None, histograms: dict):
+    for n, l, v in data["counters"]:
+        key = (n, tuple(map(tuple, l)))
+        counters[key] = counters.get(key, 0) + v
+    if gauges is not None:
+        for n, l, v in data["gauges"]:
+            key = (n, tuple(map(tuple, l)))
+            gauges[key] = gauges.get(key, 0) + v
+    for n, l, counts, total in data["histograms"]:
+        key = (n, tuple(map(tuple, l)))
+        hist = histograms.setdefault(key, [[0] * (len(BUCKETS) + 1), 0.0])
+        hist[0] = [a + b for a, b in zip(hist[0], counts)]
+        hist[1] += total
+
+
+def _adopt(path: Path):
+    """Suma a este proceso los contadores e histogramas de `path` y lo borra."""
+    claimed = path.with_name(f".adopt-{os.getpid()}-{path.name}")
+    try:
+        # rename es atómico: si dos workers ven el mismo archivo, lo suma uno solo
+        path.rename(claimed)
+    except OSError:
+        return
+    try:
+        _fold(json.loads(claimed.read_text()), _counters, None, _histograms)
+    except (OSError, ValueError, KeyError):
+        pass
+    claimed.unlink(missing_ok=True)
+
+
+def adopt_stale(startup: bool = False):
+    """Adopta los archivos de procesos muertos; al arrancar, también el de este pid (es de otra corrida)."""
+    if not METRICS_DIR:
+        return
+    for path, pid in list(_pid_files()):
+        if pid == os.getpid() and not startup:
+            continue
+        if pid == os.getpid() or not _pid_alive(pid):
+            _adopt(path)
+
+
+def _merged():
+    """Métricas de este proceso + las volcadas por los otros workers."""
+    if not METRICS_DIR:
+        return _counters, _gauges, _histograms
+
+    adopt_stale()
+    flush()
+    counters, gauges, histograms = {}, {}, {}
+    for path, pid in _pid_files():
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        _fold(data, counters, gauges if _pid_alive(pid) else None, histograms)
+    return counters, gauges, histograms
+
+
+async def flush_loop():
+    while True:
+        await asyncio.sleep(METRICS_FLUSH_S)
+        flush()
+
+
+# ---------- Formato Prometheus ----------
+
+
+def _labels(labels, extra: tuple = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+    return "{" + inner + "}"
+
+
+def render() -> str:
+    counters, gauges, histograms = _merged()
+    by_name: dict = {}
+    for (name, labels), value in counters.items():
+        by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), value in gauges.items():
+        by_name.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), (counts, total) in histograms.items():
+        lines = by_name.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total}")
+        lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+
+    out = []
+    for name, lines in by_name.items():
+        kind, help_text = METRICS.get(name, ("untyped", ""))
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+        out.extend(lines)
+
+    # Colectores: estado que se lee al momento del scrape (colas, breaker...)
+    seen = set()
+    for fn in _collectors:
+        for name, kind, help_text, labels, value in fn():
+            if name not in seen:
+                seen.add(name)
+                out.append(f"# HELP {name} {help_text}")
+                out.append(f"# TYPE {name} {kind}")
+            out.append(f"{name}{_labels(sorted(labels.items()))} {value}")
+    return "\n".join(out) + "\n"
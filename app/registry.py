@@ -0,0 +1,66 @@
+# registry.py
+"""
+Registro de elementos con id (dispositivos, lugares) cargado de un JSON:
+
+    {"default": "<id>", "<clave>": [{"id": "...", ...}, ...]}
+
+Se carga la primera vez que se usa. Si el archivo no existe queda un
+único elemento "default", armado por `fallback` con la config de las
+variables de entorno (la instalación de siempre, con uno solo).
+"""
+import json
+from pathlib import Path
+from typing import Callable
+
+
+class Registry:
+    def __init__(self, path: str | Path, key: str, label: str,
+                 parse: Callable[[dict], object], fallback: Callable[[], object],
+                 unknown: type[Exception]):
+        self.path = path
+        self.key = key          # lista dentro del JSON ("devices", "sites")
+        self.label = label      # para los mensajes de error
+        self.parse = parse      # dict del JSON -> elemento (con .id)
+        self.fallback = fallback
+        self.unknown = unknown  # excepción para un id que no está, recibe el id
+        self._items: dict | None = None
+        self._default_id: str | None = None
+
+    def load(self, path: str | Path | None = None):
+        path = Path(path or self.path)
+        if not path.exists():
+            self._items = {"default": self.fallback()}
+            self._default_id = "default"
+            return
+
+        raw = json.loads(path.read_text())
+        items = {}
+        for entry in raw.get(self.key, []):
+            item = self.parse(entry)
+            items[item.id] = item
+        if not items:
+            raise ValueError(f"{path}: no hay {self.label} en '{self.key}'")
+        default_id = raw.get("default") or next(iter(items))
+        if default_id not in items:
+            raise ValueError(f"{path}: default '{default_id}' no está en '{self.key}'")
+        self._items, self._default_id = items, default_id
+
+    def _registry(self) -> dict:
+        if self._items is None:
+            self.load()
+        return self._items
+
+    def all(self) -> list:
+        return list(self._registry().values())
+
+    def default_id(self) -> str:
+        self._registry()
+        return self._default_id
+
+    def get(self, item_id: str | None = None):
+        """Devuelve el elemento; None = el elemento por defecto."""
+        registry = self._registry()
+        item = registry.get(item_id or self._default_id)
+        if item is None:
+            raise self.unknown(item_id)
+        return item
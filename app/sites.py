@@ -0,0 +1,65 @@
+# sites.py
+"""
+Registro de lugares (jardines) para el pronóstico del clima.
+
+Se carga de un JSON (WEATHER_SITES_FILE, por defecto sites.json):
+
+    {
+      "default": "casa",
+      "sites": [
+        {"id": "casa", "lat": -34.798358, "lon": -58.357086},
+        {"id": "quinta", "lat": -34.9, "lon": -58.6, "name": "Quinta de Cañuelas"}
+      ]
+    }
+
+Todos los lugares se piden a open-meteo en una sola consulta, así que
+agregar un jardín no suma llamadas externas. Si el archivo no existe
+queda un único lugar "default" con WEATHER_LAT/WEATHER_LON.
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from .registry import Registry
+
+
+# Tus coordenadas (instalación de un solo jardín)
+WEATHER_LAT = float(os.getenv("WEATHER_LAT", "-34.798358"))
+WEATHER_LON = float(os.getenv("WEATHER_LON", "-58.357086"))
+
+WEATHER_SITES_FILE = os.getenv("WEATHER_SITES_FILE", "sites.json")
+
+
+@dataclass(frozen=True)
+class Site:
+    id: str
+    lat: float
+    lon: float
+    name: str = ""
+
+
+class UnknownSite(Exception):
+    def __init__(self, site_id: str):
+        super().__init__(f"Lugar '{site_id}' no registrado")
+        self.site_id = site_id
+
+
+def _parse(item: dict) -> Site:
+    return Site(id=item["id"], lat=float(item["lat"]), lon=float(item["lon"]), name=item.get("name", ""))
+
+
+_registry = Registry(WEATHER_SITES_FILE, "sites", "lugares", _parse,
+                     lambda: Site("default", WEATHER_LAT, WEATHER_LON), UnknownSite)
+
+
+def load(path: str | Path = WEATHER_SITES_FILE):
+    _registry.load(path)
+
+
+def all_sites() -> list[Site]:
+    return _registry.all()
+
+
+def get_site(site_id: str | None = None) -> Site:
+    """Devuelve el lugar; None = el lugar por defecto."""
+    return _registry.get(site_id)
@@ -0,0 +1,259 @@
+"""
+Backtest de las reglas del multiplicador de clima sobre datos horarios
+guardados (JSON con el formato "hourly" de open-meteo, o CSV con columnas
+time,precipitation,temperature_2m,relative_humidity_2m,wind_speed_10m
+[,precipitation_probability]).
+
+Para cada día calcula el multiplicador que habría devuelto
+/weather-multiplier (mode=auto) y, con los períodos de
+esp32/config_riego.json, los minutos de riego que se habrían aplicado
+por zona. El dato guardado se toma como pronóstico perfecto. El archivo
+de open-meteo "archive" no trae precipitation_probability: sin esa
+columna la regla de probabilidad nunca dispara.
+
+Modos:
+  endpoint  réplica exacta del endpoint actual: la ventana de 72 h
+            (ayer..mañana) anclada a la medianoche del día, con los
+            mismos cortes que compute_day/night_multiplier
+  curve     el valor de /weather-multiplier/curve en la hora de cada
+            período (ventanas móviles desde la hora de riego)
+
+Todo es numpy sobre el horizonte entero: un barrido de umbrales sobre
+años de datos horarios tarda segundos.
+
+Uso:
+    python -m app.utils.backtest_weather --weather 2022.json 2023.json
+    python -m app.utils.backtest_weather --weather hist.csv --mode curve \\
+        --grid day.skip_prob=50,60,70 night.rain_mm=3:9:2 --out detalle.csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app import wheater
+from app.weather_curve import apply_rules, rolling_stats
+
+
+FIELDS = ("precipitation", "temperature_2m", "relative_humidity_2m", "wind_speed_10m",
+          "precipitation_probability")
+SPANISH_WD = {"lunes": 0, "martes": 1, "miercoles": 2, "miércoles": 2, "jueves": 3,
+              "viernes": 4, "sabado": 5, "sábado": 5, "domingo": 6}
+
+
+# ---------- Entrada ----------
+
+
+def _read(path: Path) -> dict:
+    if path.suffix.lower() == ".csv":
+        with open(path, newline="") as f:
+            rows = list(csv.DictReader(f))
+        return {name: [row.get(name) or None for row in rows] for name in ("time",) + FIELDS}
+    return json.loads(path.read_text())["hourly"]
+
+
+def load_weather(paths: list[Path]) -> tuple[np.ndarray, dict]:
+    """Serie horaria continua desde la primera medianoche; los huecos quedan NaN."""
+    merged: dict = {}
+    for path in paths:
+        hourly = _read(path)
+        for i, t in enumerate(hourly["time"]):
+            merged[t[:13]] = {name: hourly[name][i] if name in hourly else None for name in FIELDS}
+    stamps = np.array(sorted(merged), dtype="datetime64[h]")
+    start = stamps[0].astype("datetime64[D]")
+    if stamps[0] != start:
+        start += 1
+    end = stamps[-1].astype("datetime64[D]")
+    if stamps[-1] != end + 23:
+        end -= 1
+    times = np.arange(start, end + 1, dtype="datetime64[D]").astype("datetime64[h]")
+    times = (times[:, None] + np.arange(24)).ravel()
+
+    series = {}
+    for name in FIELDS:
+        values = np.full(len(times), np.nan)
+        for key, row in merged.items():
+            i = (np.datetime64(key, "h") - times[0]).astype(int)
+            if 0 <= i < len(times) and row[name] is not None:
+                values[i] = float(row[name])
+        series[name] = values
+    if np.isnan(series["precipitation_probability"]).all():
+        series["precipitation_probability"] = np.zeros(len(times))
+    return times, series
+
+
+def load_plan(path: Path) -> tuple[list, list]:
+    """(zona, días de la semana o None = todos, inicio, fin) de cada período programado."""
+    cfg = json.loads(path.read_text())
+    pins = cfg.get("zones", {})
+    plan, skipped = [], []
+    for zone, entry in cfg.get("programed_times", {}).items():
+        if zone not in pins:
+            # Sin pin configurado el ESP lo loguea y no riega
+            skipped.extend(f"{zone} {period} (sin pin)" for period in entry.get("periods", []))
+            continue
+        days = entry.get("days", [])
+        weekdays = None if days == "all" or "all" in days else {SPANISH_WD[d.strip().lower()] for d in days}
+        for period in entry.get("periods", []):
+            a, b = period.split("-")
+            start = int(a[:2]) * 60 + int(a[3:])
+            end = int(b[:2]) * 60 + int(b[3:])
+            if end <= start:
+                # El scheduler del ESP descarta los períodos que cruzan la medianoche
+                skipped.append(f"{zone} {period} (cruza la medianoche)")
+                continue
+            plan.append((zone, weekdays, start, end))
+    return plan, skipped
+
+
+# ---------- Motor ----------
+
+
+class Backtest:
+    def __init__(self, times: np.ndarray, series: dict, plan: list, mode: str = "endpoint"):
+        self.times = times
+        self.series = series
+        self.plan = plan
+        self.mode = mode
+        self.days = times[::24].astype("datetime64[D]")
+        self.weekday = (self.days.astype(int) - 4) % 7  # 1970-01-01 fue jueves
+        self._stats: dict = {}
+
+    def _rolling(self, name: str, window: int, forward: bool) -> dict:
+        # Las ventanas no dependen de los umbrales: se reusan en todo el barrido
+        key = (name, window, forward)
+        if key not in self._stats:
+            self._stats[key] = rolling_stats(self.series[name], window, forward)
+        return self._stats[key]
+
+    def _multipliers(self, rules: dict, day_idx: np.ndarray, night_idx: np.ndarray) -> np.ndarray:
+        d, n = rules["day"], rules["night"]
+
+        def fwd(name, stat):
+            return self._rolling(name, d["window_h"], True)[stat][day_idx]
+
+        def back(name, stat):
+            return self._rolling(name, n["window_h"], False)[stat][night_idx]
+
+        day = apply_rules(d, rules["max_multiplier"], fwd("precipitation", "sum"), fwd("temperature_2m", "max"),
+                          fwd("wind_speed_10m", "max"), fwd("relative_humidity_2m", "mean"),
+                          fwd("precipitation_probability", "max"))
+        night = apply_rules(n, rules["max_multiplier"], back("precipitation", "sum"), back("temperature_2m", "max"),
+                            back("wind_speed_10m", "max"), back("relative_humidity_2m", "mean"))
+        return np.minimum(day, night)
+
+    def run(self, rules: dict) -> dict:
+        """Minutos por zona y día: {"days": [...], "zones": {zona: (base, multiplicador, aplicado)}}."""
+        if self.mode == "endpoint":
+            # Día k: ventana [k-1 00:00, k+1 23:00]; day = sus primeras horas,
+            # night = sus últimas; hace falta el día anterior y el siguiente
+            k = np.arange(1, len(self.days) - 1)
+            per_day = self._multipliers(rules, (k - 1) * 24, (k + 2) * 24 - 1)
+        else:
+            k = np.arange(len(self.days))
+            per_day = None
+
+        zones: dict = {}
+        for zone, weekdays, start, end in self.plan:
+            runs = np.ones(len(k), dtype=bool) if weekdays is None else np.isin(self.weekday[k], list(weekdays))
+            base = np.where(runs, end - start, 0)
+            if per_day is not None:
+                mult = per_day
+            else:
+                slot = k * 24 + start // 60
+                mult = self._multipliers(rules, slot, slot)
+            total = zones.setdefault(zone, [np.zeros(len(k)), np.zeros(len(k))])
+            total[0] += base
+            total[1] += base * mult
+
+        return {
+            "days": self.days[k],
+            "zones": {zone: (base, np.divide(applied, base, out=np.zeros_like(applied), where=base > 0), applied)
+                      for zone, (base, applied) in zones.items()},
+        }
+
+
+# ---------- Barrido ----------
+
+
+def _values(spec: str) -> list:
+    if ":" in spec:
+        a, b, step = (float(x) for x in spec.split(":"))
+        return [round(v, 6) for v in np.arange(a, b + step / 2, step)]
+    return [json.loads(v) for v in spec.split(",")]
+
+
+def _set(rules: dict, path: str, value):
+    keys = [int(k) if k.isdigit() else k for k in path.split(".")]
+    target = rules
+    for key in keys[:-1]:
+        target = target[key]
+    target[keys[-1]] = value
+
+
+def grid(base: dict, specs: list[str]):
+    """Reglas para cada combinación de `clave.sub=v1,v2` / `clave=desde:hasta:paso`."""
+    names = [spec.split("=", 1)[0] for spec in specs]
+    values = [_values(spec.split("=", 1)[1]) for spec in specs]
+    for combo in itertools.product(*values):
+        rules = json.loads(json.dumps(base))
+        for name, value in zip(names, combo):
+            _set(rules, name, value)
+        yield dict(zip(names, combo)), rules
+
+
+def _write_detail(path: Path, result: dict, params: dict):
+    with open(path, "a", newline="") as f:
+        w = csv.writer(f)
+        if f.tell() == 0:
+            w.writerow([*params, "date", "zone", "base_min", "multiplier", "applied_min"])
+        for zone, (base, mult, applied) in result["zones"].items():
+            for day, b, m, a in zip(result["days"], base, mult, applied):
+                if b:
+                    w.writerow([*params.values(), str(day), zone, int(b), round(float(m), 3), round(float(a), 1)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weather", type=Path, nargs="+", required=True, help="JSON/CSV horarios")
+    parser.add_argument("--config", type=Path, default=Path("esp32/config_riego.json"))
+    parser.add_argument("--mode", choices=("endpoint", "curve"), default="endpoint")
+    parser.add_argument("--grid", nargs="*", default=[], metavar="CLAVE=VALORES",
+                        help="ej. day.skip_prob=50,60,70 night.rain_mm=3:9:2 night.heat.0.1=0.2,0.4")
+    parser.add_argument("--out", type=Path, help="CSV con el detalle por día y zona")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    times, series = load_weather(args.weather)
+    plan, skipped = load_plan(args.config)
+    bt = Backtest(times, series, plan, args.mode)
+    print(f"{len(bt.days)} días de datos ({bt.days[0]} a {bt.days[-1]}), {len(plan)} períodos, "
+          f"cargado en {time.perf_counter() - t0:.2f} s")
+    for period in skipped:
+        print(f"  período ignorado, el ESP no lo corre: {period}")
+    if args.out and args.out.exists():
+        args.out.unlink()
+
+    t0 = time.perf_counter()
+    runs = 0
+    for params, rules in grid(wheater.RULES, args.grid):
+        result = bt.run(rules)
+        runs += 1
+        label = " ".join(f"{k}={v}" for k, v in params.items()) or "reglas actuales"
+        base = sum(z[0] for z in result["zones"].values())
+        applied = sum(z[2] for z in result["zones"].values())
+        skipped_days = int(((base > 0) & (applied == 0)).sum())
+        base, applied = float(np.sum(base)), float(np.sum(applied))
+        print(f"{label:<40} base={base:9.0f} min  aplicado={applied:9.0f} min  "
+              f"({applied / base if base else 0:5.2f}x)  días sin riego={skipped_days}")
+        if args.out:
+            _write_detail(args.out, result, params)
+    print(f"{runs} combinaciones en {time.perf_counter() - t0:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark: cliente nuevo por request vs cliente compartido keep-alive.
+
+Levanta un ESP falso local (app/utils/fake_esp.py) con un costo por
+conexión nueva que simula el handshake por WiFi y mide la latencia de
+N requests a /ls con cada estrategia.
+
+Uso:
+    python -m app.utils.bench_esp_pool --requests 200 --connect-delay 0.03
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+from app import esp_client
+from app.devices import Device
+from app.utils.fake_esp import FakeEsp
+
+
+def _stats(name, samples, connections):
+    samples = sorted(samples)
+    p95 = samples[int(len(samples) * 0.95) - 1]
+    print(f"{name:<22} media={statistics.mean(samples) * 1000:7.2f} ms  "
+          f"p50={statistics.median(samples) * 1000:7.2f} ms  "
+          f"p95={p95 * 1000:7.2f} ms  conexiones={connections}")
+
+
+async def _per_request(host, n):
+    # Lo que hacía _esp_get antes: un AsyncClient + BasicAuth por llamada
+    samples = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        auth = httpx.BasicAuth("admin", "1234")
+        async with httpx.AsyncClient(timeout=esp_client.ESP_TIMEOUT) as client:
+            r = await client.get(f"{host}/ls", auth=auth)
+        r.raise_for_status()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+async def _pooled(host, n):
+    samples = []
+    client = esp_client.build_client(Device("bench", host, "admin", "1234"))
+    try:
+        for _ in range(n):
+            t0 = time.perf_counter()
+            r = await client.get("/ls", timeout=esp_client.route_timeout("/ls"))
+            r.raise_for_status()
+            samples.append(time.perf_counter() - t0)
+    finally:
+        await client.aclose()
+    return samples
+
+
+async def main(args):
+    for name, bench in (("cliente por request", _per_request), ("cliente compartido", _pooled)):
+        esp = FakeEsp(latency=args.latency, connect_delay=args.connect_delay)
+        port = await esp.start()
+        try:
+            samples = await bench(f"http://127.0.0.1:{port}", args.requests)
+        finally:
+            await esp.stop()
+        _stats(name, samples, esp.connections)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.005, help="costo por request (s)")
+    parser.add_argument("--connect-delay", type=float, default=0.03, help="costo por conexión nueva (s)")
+    asyncio.run(main(parser.parse_args()))
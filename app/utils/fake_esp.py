@@ -0,0 +1,171 @@
+"""
+ESP32 falso para pruebas locales y benchmarks del proxy.
+
+Imita las rutas del firmware (/ls, /cat, /tail, /rm, /upload, /zone,
+/batch, /status, /execute) con auth Basic. Permite simular la latencia de la WiFi:
+  - connect_delay: costo extra de cada conexión TCP nueva (handshake)
+  - latency: costo de cada request
+  - keep_alive: si es False cierra la conexión tras cada respuesta
+    (como hacía handle_client en esp32/server.py antes del keep-alive)
+  - compress: como el firmware, responde con Content-Encoding deflate o
+    gzip si el request lo acepta y la respuesta pasa de 256 bytes
+
+Uso:
+    python -m app.utils.fake_esp --port 8081 --connect-delay 0.05
+    ESP_HOST=http://127.0.0.1:8081 python -m uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import base64
+import json
+import zlib
+from urllib.parse import parse_qsl
+
+
+class FakeEsp:
+    def __init__(self, user="admin", password="1234", latency=0.0,
+                 connect_delay=0.0, keep_alive=True, compress=True):
+        self.token = base64.b64encode(f"{user}:{password}".encode()).decode()
+        self.latency = latency
+        self.connect_delay = connect_delay
+        self.keep_alive = keep_alive
+        self.compress = compress
+        self.files = {"log.txt": "00:00:00 - Iniciando sistema\n", "config_riego.json": "{}"}
+        self.zones = {f"zona{i}": pin for i, pin in enumerate([19, 5, 18, 25, 26, 27], 1)}
+        self.zone_state = {z: "off" for z in self.zones}
+        self.connections = 0
+        self.requests = 0
+        self._server = None
+
+    # ---------- rutas ----------
+    def _route(self, method, route, params, body):
+        filename = params.get("filename") or params.get("file")
+        if route == "/ls":
+            return 200, {"folder": params.get("filename", "."), "files": sorted(self.files)}
+        if route == "/cat":
+            if filename not in self.files:
+                return 404, {"error": f"Archivo no encontrado: {filename}"}
+            return 200, {"file": filename, "content": self.files[filename]}
+        if route == "/tail":
+            if filename not in self.files:
+                return 404, {"error": f"Archivo no encontrado: {filename}"}
+            n = int(params.get("n", 20))
+            return 200, "\n".join(self.files[filename].splitlines()[-n:])
+        if route == "/rm":
+            if self.files.pop(filename, None) is None:
+                return 404, {"error": "No se pudo eliminar"}
+            return 200, {"status": "Archivo eliminado", "file": filename}
+        if route == "/upload" and method == "POST":
+            self.files[filename] = body.decode()
+            return 200, {"status": "Archivo guardado", "file": filename}
+        if route == "/zone":
+            zone = params.get("zone", "")
+            if zone.isdigit():
+                zone = f"zona{zone}"
+            if zone not in self.zones:
+                return 404, {"error": f"Zona '{zone}' no encontrada en config"}
+            action = params.get("action", "on").lower()
+            self.zone_state[zone] = action
+            return 200, {"status": "ok", "zone": zone, "action": action, "pin": self.zones[zone]}
+        if route == "/batch" and method == "POST":
+            ops = json.loads(body).get("ops", [])
+            names = [f"zona{op['zone']}" if str(op["zone"]).isdigit() else op["zone"] for op in ops]
+            bad = [i for i, z in enumerate(names) if z not in self.zones]
+            if not ops or bad:
+                return 400, {"error": "Batch rechazado, no se aplicó nada", "errors": bad}
+            results = []
+            for zone, op in zip(names, ops):
+                self.zone_state[zone] = op.get("action", "on")
+                results.append({"zone": zone, "action": self.zone_state[zone], "pin": self.zones[zone]})
+            return 200, {"status": "ok", "results": results}
+        if route == "/status":
+            zones = {z: {"pin": pin, "on": self.zone_state[z] == "on"} for z, pin in self.zones.items()}
+            return 200, {"zones": zones, "log_size": len(self.files.get("log.txt", "")), "mem_free": 50000}
+        if route == "/execute":
+            return 200, {"result": "OK", "error": None}
+        return 404, {"error": f"Ruta {route} no encontrada"}
+
+    # ---------- HTTP ----------
+    async def _handle(self, reader, writer):
+        self.connections += 1
+        if self.connect_delay:
+            await asyncio.sleep(self.connect_delay)
+        try:
+            while True:
+                req_line = await reader.readline()
+                if not req_line:
+                    break
+                method, path = req_line.decode().split(" ")[:2]
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    k, _, v = line.decode().partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                body = b""
+                length = int(headers.get("content-length", 0))
+                if length:
+                    body = await reader.readexactly(length)
+
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+
+                route, _, query = path.partition("?")
+                if headers.get("authorization", "").split(" ")[-1] != self.token:
+                    status, data = 401, {"error": "unauthorized"}
+                else:
+                    status, data = self._route(method, route, dict(parse_qsl(query)), body)
+
+                if isinstance(data, dict):
+                    payload, ctype = json.dumps(data).encode(), "application/json"
+                else:
+                    payload, ctype = data.encode(), "text/plain"
+                encoding = ""
+                accepted = headers.get("accept-encoding", "")
+                if self.compress and len(payload) >= 256:
+                    if "deflate" in accepted:
+                        payload, encoding = zlib.compress(payload), "Content-Encoding: deflate\r\n"
+                    elif "gzip" in accepted:
+                        z = zlib.compressobj(wbits=31)
+                        payload, encoding = z.compress(payload) + z.flush(), "Content-Encoding: gzip\r\n"
+                conn = "keep-alive" if self.keep_alive else "close"
+                writer.write(
+                    f"HTTP/1.1 {status} X\r\nContent-Type: {ctype}\r\n{encoding}"
+                    f"Content-Length: {len(payload)}\r\nConnection: {conn}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not self.keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _main(args):
+    esp = FakeEsp(latency=args.latency, connect_delay=args.connect_delay,
+                  keep_alive=not args.close, compress=not args.no_compress)
+    port = await esp.start(args.host, args.port)
+    print(f"ESP falso escuchando en http://{args.host}:{port}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--connect-delay", type=float, default=0.0)
+    parser.add_argument("--close", action="store_true", help="cerrar la conexión tras cada respuesta")
+    parser.add_argument("--no-compress", action="store_true", help="no comprimir las respuestas")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""
+open-meteo falso para pruebas locales del multiplicador de clima.
+
+Responde /v1/forecast con la misma forma que la API real (bloque
+"hourly" con 72 horas: ayer, hoy y mañana) y valores fijos que se
+pueden elegir por línea de comandos; con varias coordenadas responde una
+lista, como open-meteo. Cuenta los pedidos recibidos.
+
+Uso:
+    python -m app.utils.fake_weather --port 8082 --rain 0 --temp 31
+    WEATHER_API_URL=http://127.0.0.1:8082/v1/forecast python -m uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import json
+from datetime import date, datetime, timedelta
+from urllib.parse import parse_qsl
+
+
+class FakeWeather:
+    def __init__(self, rain=0.0, temp=25.0, humidity=60.0, wind=10.0, prob=10.0, latency=0.0):
+        self.values = {"precipitation": rain, "temperature_2m": temp, "relative_humidity_2m": humidity,
+                       "wind_speed_10m": wind, "precipitation_probability": prob}
+        self.latency = latency
+        self.fail = False  # True: responde 503 (simula caída)
+        self.requests = 0
+        self._server = None
+
+    def forecast(self, params: dict) -> dict | list:
+        start = datetime.combine(date.today() - timedelta(days=1), datetime.min.time())
+        hours = [(start + timedelta(hours=h)).strftime("%Y-%m-%dT%H:%M") for h in range(72)]
+        fields = params.get("hourly", "").split(",")
+        # Varias coordenadas separadas por coma: una respuesta por lugar, en una lista
+        coords = list(zip(params.get("latitude", "0").split(","), params.get("longitude", "0").split(",")))
+        results = [{
+            "latitude": float(lat), "longitude": float(lon),
+            "hourly": {"time": hours, **{f: [self.values.get(f, 0.0)] * 72 for f in fields if f}},
+        } for lat, lon in coords]
+        return results[0] if len(results) == 1 else results
+
+    async def _handle(self, reader, writer):
+        try:
+            req_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b""):
+                pass
+            self.requests += 1
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            path = req_line.decode().split(" ")[1]
+            route, _, query = path.partition("?")
+            if self.fail:
+                status, data = 503, {"error": True, "reason": "fake outage"}
+            elif route == "/v1/forecast":
+                status, data = 200, self.forecast(dict(parse_qsl(query)))
+            else:
+                status, data = 404, {"error": True, "reason": f"{route} no existe"}
+            payload = json.dumps(data).encode()
+            writer.write(f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+            await writer.drain()
+        except (ConnectionError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host="127.0.0.1", port=0):
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+
+async def _main(args):
+    fake = FakeWeather(rain=args.rain, temp=args.temp, humidity=args.humidity, wind=args.wind,
+                       prob=args.prob, latency=args.latency)
+    port = await fake.start(args.host, args.port)
+    print(f"open-meteo falso escuchando en http://{args.host}:{port}/v1/forecast")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8082)
+    parser.add_argument("--rain", type=float, default=0.0, help="mm por hora")
+    parser.add_argument("--temp", type=float, default=25.0)
+    parser.add_argument("--humidity", type=float, default=60.0)
+    parser.add_argument("--wind", type=float, default=10.0)
+    parser.add_argument("--prob", type=float, default=10.0, help="probabilidad de lluvia (%%)")
+    parser.add_argument("--latency", type=float, default=0.0)
+    asyncio.run(_main(parser.parse_args()))
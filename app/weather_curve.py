@@ -0,0 +1,83 @@
+# weather_curve.py
+"""
+Curva del multiplicador de riego hora por hora sobre todo el horizonte
+de open-meteo (ayer + hoy + mañana, 72 horas), calculada con numpy en
+una pasada: sumas, máximos y promedios móviles sobre los arrays
+"hourly" y las mismas reglas que compute_day/night_multiplier.
+
+Para cada hora t:
+  - day:   ventana hacia adelante [t, t + window_h) (lo que va a llover)
+  - night: ventana hacia atrás (t - window_h, t]   (lo que ya llovió)
+  - auto:  el menor de los dos, como en /weather-multiplier?mode=auto
+
+En los bordes del horizonte las ventanas quedan truncadas; `partial`
+marca esas horas.
+"""
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _series(hourly: dict, name: str) -> np.ndarray:
+    # open-meteo manda null cuando le falta un dato: queda NaN
+    return np.asarray(hourly[name], dtype=float)
+
+
+def _windows(values: np.ndarray, window: int, forward: bool, fill: float) -> np.ndarray:
+    """Matriz (horas x window) con la ventana de cada hora, rellenada en el borde."""
+    pad = (0, window - 1) if forward else (window - 1, 0)
+    return sliding_window_view(np.pad(values, pad, constant_values=fill), window)
+
+
+def rolling_stats(values: np.ndarray, window: int, forward: bool) -> dict:
+    """sum, max y mean de la ventana de cada hora; `full` si la ventana no quedó truncada."""
+    valid = (~np.isnan(values)).astype(float)
+    count = _windows(valid, window, forward, 0.0).sum(axis=1)
+    total = np.nansum(_windows(values, window, forward, 0.0), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "sum": total,
+            "max": np.nanmax(_windows(np.nan_to_num(values, nan=-np.inf), window, forward, -np.inf), axis=1),
+            "mean": total / count,
+            "full": _windows(np.ones_like(values), window, forward, 0.0).sum(axis=1) == window,
+        }
+
+
+def apply_rules(rules: dict, max_mult: float, rain, temp, wind, humidity, prob=None) -> np.ndarray:
+    mult = np.where(rain >= rules["rain_mm"], rules["rain_factor"], 1.0)
+    for threshold, add in rules["heat"]:
+        mult = mult + np.where(temp > threshold, add, 0.0)
+    mult = mult + np.where(wind > rules["wind_kmh"], rules["wind_add"], 0.0)
+    mult = mult + np.where((humidity > rules["humid_pct"]) & (temp < rules["cool_c"]), rules["humid_add"], 0.0)
+    skip = rain >= rules["skip_rain_mm"]
+    if prob is not None:
+        skip |= prob > rules["skip_prob"]
+    return np.clip(np.where(skip, 0.0, mult), 0.0, max_mult)
+
+
+def multiplier_curve(data: dict, rules: dict) -> dict:
+    hourly = data["hourly"]
+    rain = _series(hourly, "precipitation")
+    temp = _series(hourly, "temperature_2m")
+    wind = _series(hourly, "wind_speed_10m")
+    humidity = _series(hourly, "relative_humidity_2m")
+    prob = _series(hourly, "precipitation_probability")
+    max_mult = rules["max_multiplier"]
+
+    d, n = rules["day"], rules["night"]
+    fwd = {name: rolling_stats(v, d["window_h"], forward=True)
+           for name, v in (("rain", rain), ("temp", temp), ("wind", wind), ("humidity", humidity), ("prob", prob))}
+    back = {name: rolling_stats(v, n["window_h"], forward=False)
+            for name, v in (("rain", rain), ("temp", temp), ("wind", wind), ("humidity", humidity))}
+
+    day = apply_rules(d, max_mult, fwd["rain"]["sum"], fwd["temp"]["max"], fwd["wind"]["max"],
+                      fwd["humidity"]["mean"], fwd["prob"]["max"])
+    night = apply_rules(n, max_mult, back["rain"]["sum"], back["temp"]["max"], back["wind"]["max"],
+                        back["humidity"]["mean"])
+
+    return {
+        "time": list(hourly["time"]),
+        "day": np.round(day, 3).tolist(),
+        "night": np.round(night, 3).tolist(),
+        "auto": np.round(np.minimum(day, night), 3).tolist(),
+        "partial": (~(fwd["rain"]["full"] & back["rain"]["full"])).tolist(),
+    }
@@ -1,11 +1,23 @@
-from fastapi import APIRouter
-from datetime import datetime, time
-import requests
-
-
-# Tus coordenadas
-LAT = -34.798358
-LON = -58.357086
+from fastapi import APIRouter, HTTPException, Query
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from time import perf_counter
+import asyncio
+import json
+import os
+import httpx
+from . import metrics, sites
+from .sites import Site, UnknownSite
+from .weather_curve import multiplier_curve
+
+# Para pruebas se puede apuntar a un server local (app/utils/fake_weather.py)
+WEATHER_API_URL = os.getenv("WEATHER_API_URL", "https://api.open-meteo.com/v1/forecast")
+WEATHER_TIMEOUT = float(os.getenv("WEATHER_TIMEOUT", "10"))
+WEATHER_CACHE_FILE = Path(os.getenv("WEATHER_CACHE_FILE", "weather_cache.json"))
+# open-meteo es horario: el dato vale hasta la próxima hora (+ un margen
+# para que el modelo ya esté actualizado cuando volvemos a pedir)
+WEATHER_REFRESH_MARGIN_S = float(os.getenv("WEATHER_REFRESH_MARGIN_S", "120"))
+WEATHER_RETRY_S = float(os.getenv("WEATHER_RETRY_S", "60"))
 
 
 def is_night_mode():
@@ -13,25 +25,198 @@ def is_night_mode():
     return now >= time(18, 0) or now <= time(4, 0)
 
 
-def fetch_weather():
-    url = (
-        "https://api.open-meteo.com/v1/forecast?"
-        f"latitude={LAT}&longitude={LON}"
-        "&hourly=temperature_2m,precipitation,relative_humidity_2m,wind_speed_10m,precipitation_probability"
-        "&past_days=1&forecast_days=2"
-        "&timezone=auto"
-    )
+async def fetch_weather(targets: list[Site]) -> dict[str, dict]:
+    """Pronóstico de todos los lugares en una sola consulta (open-meteo acepta listas de coordenadas)."""
+    params = {
+        "latitude": ",".join(str(site.lat) for site in targets),
+        "longitude": ",".join(str(site.lon) for site in targets),
+        "hourly": "temperature_2m,precipitation,relative_humidity_2m,wind_speed_10m,precipitation_probability",
+        "past_days": 1, "forecast_days": 2,
+        "timezone": "auto",
+    }
 
-    r = requests.get(url, timeout=10)
-    r.raise_for_status()
-    return r.json()
+    t0 = perf_counter()
+    try:
+        async with httpx.AsyncClient(timeout=WEATHER_TIMEOUT) as client:
+            r = await client.get(WEATHER_API_URL, params=params)
+            r.raise_for_status()
+            payload = r.json()
+    except Exception:
+        metrics.inc("weather_fetch_errors_total")
+        raise
+    finally:
+        metrics.observe("weather_fetch_duration_seconds", perf_counter() - t0)
+    # Con una sola coordenada open-meteo devuelve un objeto, con varias una lista en el mismo orden
+    if isinstance(payload, dict):
+        payload = [payload]
+    if len(payload) != len(targets):
+        raise ValueError(f"open-meteo devolvió {len(payload)} lugares, se pidieron {len(targets)}")
+    return {site.id: data for site, data in zip(targets, payload)}
+
+
+def _next_refresh(fetched_at: datetime) -> datetime:
+    top = fetched_at.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    return top + timedelta(seconds=WEATHER_REFRESH_MARGIN_S)
+
+
+class WeatherCache:
+    """
+    Último pronóstico de cada lugar en memoria y en disco. Todos se
+    renuevan juntos, en una consulta, y valen hasta la próxima hora;
+    vencidos se siguen sirviendo mientras una tarea de fondo los renueva
+    (stale-while-revalidate). Si open-meteo no responde, quedan los últimos.
+    """
+
+    def __init__(self, path: Path = WEATHER_CACHE_FILE):
+        self.path = path
+        self.data: dict[str, dict] = {}  # id del lugar -> respuesta de open-meteo
+        self.fetched_at: datetime | None = None
+        self.last_error: str | None = None
+        self._refreshing: asyncio.Task | None = None
+        self._task: asyncio.Task | None = None
+        self._load()
+
+    def _load(self):
+        try:
+            saved = json.loads(self.path.read_text())
+            fetched_at = datetime.fromisoformat(saved["fetched_at"])
+            for site in sites.all_sites():
+                entry = saved["sites"].get(site.id)
+                # Si le cambiaron las coordenadas a un lugar, lo guardado no sirve
+                if entry is not None and (entry["lat"], entry["lon"]) == (site.lat, site.lon):
+                    self.data[site.id] = entry["data"]
+            if self.data:
+                self.fetched_at = fetched_at
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    def _save(self):
+        registry = {site.id: site for site in sites.all_sites()}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps({
+            "fetched_at": self.fetched_at.isoformat(),
+            "sites": {sid: {"lat": registry[sid].lat, "lon": registry[sid].lon, "data": data}
+                      for sid, data in self.data.items() if sid in registry},
+        }))
+        tmp.replace(self.path)
+
+    @property
+    def stale(self) -> bool:
+        if self.fetched_at is None or any(site.id not in self.data for site in sites.all_sites()):
+            return True
+        return datetime.now() >= _next_refresh(self.fetched_at)
+
+    async def _refresh(self):
+        try:
+            data = await fetch_weather(sites.all_sites())
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            raise
+        self.data, self.fetched_at, self.last_error = data, datetime.now(), None
+        try:
+            await asyncio.to_thread(self._save)
+        except OSError as e:
+            print(f"ERROR guardando cache del clima: {e}")
+
+    def refresh(self) -> asyncio.Task:
+        """Una sola consulta en vuelo: los que piden a la vez esperan la misma."""
+        if self._refreshing is None or self._refreshing.done():
+            self._refreshing = asyncio.ensure_future(self._refresh())
+            # Si nadie la espera, que el error no quede como "never retrieved"
+            self._refreshing.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return self._refreshing
+
+    async def get(self, site_id: str | None = None) -> dict:
+        """Pronóstico del lugar (None = el lugar por defecto). UnknownSite si no existe."""
+        site = sites.get_site(site_id)
+        if site.id not in self.data:
+            # Arranque en frío (o lugar nuevo): no hay nada que servir, hay que esperar
+            await asyncio.shield(self.refresh())
+        elif self.stale:
+            self.refresh()
+        return self.data[site.id]
+
+    async def run(self):
+        """Renueva en segundo plano a cada hora, sin esperar a que alguien pida."""
+        while True:
+            if self.stale:
+                try:
+                    await asyncio.shield(self.refresh())
+                except Exception as e:
+                    print(f"ERROR actualizando el clima: {e}")
+                    await asyncio.sleep(WEATHER_RETRY_S)
+                    continue
+            wait = (_next_refresh(self.fetched_at) - datetime.now()).total_seconds()
+            await asyncio.sleep(max(wait, 1))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def info(self, site_id: str | None = None) -> dict:
+        return {"site": sites.get_site(site_id).id,
+                "fetched_at": self.fetched_at.isoformat() if self.fetched_at else None,
+                "stale": self.stale, "last_error": self.last_error}
+
+
+weather_cache = WeatherCache()
 
 
 # ------------------ MULTIPLIERS ----------------------- #
+
+# Umbrales de las reglas. WEATHER_RULES_FILE (JSON) puede pisar cualquiera,
+# ej. {"day": {"skip_prob": 70}, "night": {"heat": [[32, 0.5]]}}
+DEFAULT_RULES = {
+    "max_multiplier": 2.5,
+    "night": {  # últimas window_h horas: lo que ya llovió
+        "window_h": 24,
+        "skip_rain_mm": 40,
+        "rain_mm": 5, "rain_factor": 0.5,
+        "heat": [[30, 0.4], [35, 0.3]],
+        "wind_kmh": 20, "wind_add": 0.2,
+        "humid_pct": 70, "cool_c": 24, "humid_add": -0.3,
+    },
+    "day": {  # próximas window_h horas: pronóstico
+        "window_h": 12,
+        "skip_prob": 60, "skip_rain_mm": 10,
+        "rain_mm": 1, "rain_factor": 0.5,
+        "heat": [[30, 0.3], [35, 0.3]],
+        "wind_kmh": 20, "wind_add": 0.2,
+        "humid_pct": 70, "cool_c": 24, "humid_add": -0.3,
+    },
+}
+
+
+def _merge(base: dict, override: dict) -> dict:
+    out = dict(base)
+    for key, value in override.items():
+        out[key] = _merge(base[key], value) if isinstance(value, dict) and isinstance(base.get(key), dict) else value
+    return out
+
+
+def load_rules(path: str | None = os.getenv("WEATHER_RULES_FILE")) -> dict:
+    if not path:
+        return DEFAULT_RULES
+    with open(path) as f:
+        return _merge(DEFAULT_RULES, json.load(f))
+
+
+RULES = load_rules()
+
+
 def _summary(mult, rules, **values):
     """Helper para devolver el formato estándar."""
     return {
-        "multiplier": max(0, min(mult, 2.5)),
+        "multiplier": max(0, min(mult, RULES["max_multiplier"])),
         "details": {
             **values,
             "rules": rules
@@ -39,42 +224,47 @@ def _summary(mult, rules, **values):
     }
 
 
+def _common_rules(r, mult, rules, temp_max, wind_max, humidity):
+    # CALOR
+    for threshold, add in r["heat"]:
+        if temp_max > threshold:
+            mult += add
+            rules.append(f"Temp > {threshold}°C → {add:+}")
+
+    # VIENTO
+    if wind_max > r["wind_kmh"]:
+        mult += r["wind_add"]
+        rules.append(f"Viento > {r['wind_kmh']} km/h → {r['wind_add']:+}")
+
+    # HÚMEDO Y FRESCO
+    if humidity > r["humid_pct"] and temp_max < r["cool_c"]:
+        mult += r["humid_add"]
+        rules.append(f"Humedad > {r['humid_pct']}% y Temp < {r['cool_c']}°C → {r['humid_add']:+}")
+    return mult
+
+
 def compute_night_multiplier(data):
     hourly = data["hourly"]
+    r = RULES["night"]
+    w = r["window_h"]
 
-    rain = sum(hourly["precipitation"][-24:])
-    temp_max = max(hourly["temperature_2m"][-24:])
-    wind_max = max(hourly["wind_speed_10m"][-24:])
-    humidity = sum(hourly["relative_humidity_2m"][-24:]) / 24
+    rain = sum(hourly["precipitation"][-w:])
+    temp_max = max(hourly["temperature_2m"][-w:])
+    wind_max = max(hourly["wind_speed_10m"][-w:])
+    humidity = sum(hourly["relative_humidity_2m"][-w:]) / w
 
     mult = 1.0
     rules = []
 
     # LLUVIA REAL
-    if rain >= 40:
-        return _summary(0.0, ["Lluvia >= 40 mm → mult = 0"],
+    if rain >= r["skip_rain_mm"]:
+        return _summary(0.0, [f"Lluvia >= {r['skip_rain_mm']} mm → mult = 0"],
                         rain_mm=rain, temp_max=temp_max, wind_max=wind_max, humidity_mean=humidity)
-    if rain >= 5:
-        mult *= 0.5
-        rules.append("5-40 mm lluvia → mult *= 0.3")
+    if rain >= r["rain_mm"]:
+        mult *= r["rain_factor"]
+        rules.append(f"{r['rain_mm']}-{r['skip_rain_mm']} mm lluvia → mult *= {r['rain_factor']}")
 
-    # CALOR
-    if temp_max > 30:
-        mult += 0.4
-        rules.append("Temp > 30°C → +0.4")
-    if temp_max > 35:
-        mult += 0.3
-        rules.append("Temp > 35°C → +0.3")
-
-    # VIENTO
-    if wind_max > 20:
-        mult += 0.2
-        rules.append("Viento > 20 km/h → +0.2")
-
-    # HÚMEDO Y FRESCO
-    if humidity > 70 and temp_max < 24:
-        mult -= 0.3
-        rules.append("Humedad > 70% y Temp < 24°C → -0.3")
+    mult = _common_rules(r, mult, rules, temp_max, wind_max, humidity)
 
     return _summary(mult, rules,
                     rain_mm=rain, temp_max=temp_max,
@@ -83,58 +273,94 @@ def compute_night_multiplier(data):
 
 def compute_day_multiplier(data):
     hourly = data["hourly"]
+    r = RULES["day"]
+    w = r["window_h"]
 
-    rain_fc = sum(hourly["precipitation"][:12])
-    prob = max(hourly["precipitation_probability"][:12])
-    temp_max = max(hourly["temperature_2m"][:12])
-    wind_max = max(hourly["wind_speed_10m"][:12])
-    humidity = sum(hourly["relative_humidity_2m"][:12]) / 12
+    rain_fc = sum(hourly["precipitation"][:w])
+    prob = max(hourly["precipitation_probability"][:w])
+    temp_max = max(hourly["temperature_2m"][:w])
+    wind_max = max(hourly["wind_speed_10m"][:w])
+    humidity = sum(hourly["relative_humidity_2m"][:w]) / w
 
     mult = 1.0
     rules = []
 
     # LLUVIA FUTURA
-    if prob > 60 or rain_fc >= 10:
-        return _summary(0.0, ["Prob > 60% o lluvia >= 10 mm → mult = 0"],
+    if prob > r["skip_prob"] or rain_fc >= r["skip_rain_mm"]:
+        return _summary(0.0, [f"Prob > {r['skip_prob']}% o lluvia >= {r['skip_rain_mm']} mm → mult = 0"],
                         rain_forecast_mm=rain_fc, prob_precip=prob,
                         temp_max=temp_max, wind_max=wind_max, humidity_mean=humidity)
 
-    if rain_fc >= 1:
-        mult *= 0.5
-        rules.append("1-10 mm lluvia → mult *= 0.3")
+    if rain_fc >= r["rain_mm"]:
+        mult *= r["rain_factor"]
+        rules.append(f"{r['rain_mm']}-{r['skip_rain_mm']} mm lluvia → mult *= {r['rain_factor']}")
 
-    # CALOR
-    if temp_max > 30:
-        mult += 0.3
-        rules.append("Temp > 30°C → +0.3")
-    if temp_max > 35:
-        mult += 0.3
-        rules.append("Temp > 35°C → +0.3")
-
-    # VIENTO
-    if wind_max > 20:
-        mult += 0.2
-        rules.append("Viento > 20 km/h → +0.2")
-
-    # HÚMEDO Y FRESCO
-    if humidity > 70 and temp_max < 24:
-        mult -= 0.3
-        rules.append("Humedad > 70% y Temp < 24°C → -0.3")
+    mult = _common_rules(r, mult, rules, temp_max, wind_max, humidity)
 
     return _summary(mult, rules,
                     rain_forecast_mm=rain_fc, prob_precip=prob,
                     temp_max=temp_max, wind_max=wind_max,
                     humidity_mean=humidity)
 
+
+_curve_memo: dict[str, tuple] = {}
+
+
+def _curve(site_id: str, data: dict) -> dict:
+    """La curva se calcula una vez por pronóstico descargado de cada lugar."""
+    memo = _curve_memo.get(site_id)
+    if memo is None or memo[0] is not data:
+        memo = _curve_memo[site_id] = (data, multiplier_curve(data, RULES))
+    return memo[1]
+
 # ------------------ ENDPOINT --------------------------- #
 
 
 weather_router = APIRouter()
 
+SITE_QUERY = Query(None, description="Id del lugar (sites.json); sin esto, el lugar por defecto")
+
+
+async def _weather_data(site: str | None) -> dict:
+    try:
+        return await weather_cache.get(site)
+    except UnknownSite as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Sin datos del clima: {e}")
+
+
+@weather_router.get("/weather-sites")
+async def weather_sites():
+    return {"default": sites.get_site().id,
+            "sites": [{"id": s.id, "name": s.name, "lat": s.lat, "lon": s.lon, "cached": s.id in weather_cache.data}
+                      for s in sites.all_sites()]}
+
+
+@weather_router.get("/weather-multiplier/curve")
+async def weather_multiplier_curve(at: datetime | None = Query(None, description="Hora puntual (ISO); sin esto, la curva entera"),
+                                   site: str | None = SITE_QUERY):
+    """
+    Multiplicador hora por hora (day, night y auto) para todo el horizonte
+    del pronóstico. Con `at` devuelve solo la hora que lo contiene.
+    """
+    data = await _weather_data(site)
+    curve = _curve(sites.get_site(site).id, data)
+
+    if at is not None:
+        slot = at.replace(minute=0, second=0, microsecond=0).strftime("%Y-%m-%dT%H:%M")
+        try:
+            i = curve["time"].index(slot)
+        except ValueError:
+            raise HTTPException(status_code=404, detail=f"{slot} está fuera del pronóstico")
+        return {key: values[i] for key, values in curve.items()} | {"weather": weather_cache.info(site)}
+
+    return {**curve, "rules": RULES, "weather": weather_cache.info(site)}
+
 
 @weather_router.get("/weather-multiplier")
-def weather_multiplier(mode=None):
-    data = fetch_weather()
+async def weather_multiplier(mode=None, site: str | None = SITE_QUERY):
+    data = await _weather_data(site)
     mode = mode or "auto"
     if mode == "auto":
         night_r = compute_night_multiplier(data)
@@ -157,4 +383,5 @@ def weather_multiplier(mode=None):
             "error": "invalid mode, use 'day', 'night' or 'auto'"
         }, 400
 
+    response["weather"] = weather_cache.info(site)
     return response
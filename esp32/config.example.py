@@ -2,4 +2,16 @@ WIFI_SSID = "Telecentro-XXXX"
 WIFI_PASS = "ANDJKASHDASBH"
 HTTP_USER = "admin"
 HTTP_PASS = "1234"
-sleep_interval = "10"
\ No newline at end of file
+sleep_interval = "10"
+# Memoria libre mínima (bytes); por debajo se descargan los endpoints menos usados
+LAZY_MIN_FREE = 30000
+
+# Servidor HTTP: conexiones simultáneas, segundos sin requests antes de cerrar, requests por conexión
+HTTP_MAX_CONNECTIONS = 4
+HTTP_IDLE_S = 30
+HTTP_MAX_REQUESTS = 100
+HTTP_HEAD_MAX = 1024  # línea del request + headers, más grande responde 431
+HTTP_ALLOC_STATS = False  # True: /routes muestra bytes allocados por request
+HTTP_DEFLATE = True  # comprimir respuestas (deflate/gzip) si el cliente las acepta
+HTTP_DEFLATE_WBITS = 10  # ventana de 2**10 bytes
+HTTP_DEFLATE_INLINE_MAX = 4096  # respuestas no streameadas más grandes van sin comprimir
@@ -1,7 +1,10 @@
+import gc
+import os
 import ujson as json
 from boot import CONFIG_PATH
 import uasyncio as asyncio
-from server_utils import send_response, parse_query, log
+from http_parser import parse_query
+from server_utils import send_response, log
 from machine import Pin
 
 
@@ -17,6 +20,15 @@ def load_zones_map():
         return {}
 
 
+async def _delayed_off(pin, name, pin_n, s):
+    await asyncio.sleep(s)
+    try:
+        pin.value(1)
+        log(f"Endpoint: Zona {name} (pin {pin_n}) apagada por timeout")
+    except Exception as e:
+        log(f"Error apagando zona {name}: {e}")
+
+
 async def handle(writer, query=""):
     """Parametros (query):
     - zone: nombre de la zona (ej. zona1) o número (entonces se busca zonaN)
@@ -69,14 +81,6 @@ async def handle(writer, query=""):
                     dur = None
                 if dur and dur > 0:
                     # programar apagado sin bloquear
-                    async def _delayed_off(pin, name, pin_n, s):
-                        await asyncio.sleep(s)
-                        try:
-                            pin.value(1)
-                            log(f"Endpoint: Zona {name} (pin {pin_n}) apagada por timeout")
-                        except Exception as e:
-                            log(f"Error apagando zona {name}: {e}")
-
                     asyncio.create_task(_delayed_off(p, zone, pin_num, dur))
 
             send_response(writer, {"status": "ok", "zone": zone, "action": "on", "pin": pin_num, "duration": duration})
@@ -97,3 +101,84 @@ async def handle(writer, query=""):
 
     else:
         send_response(writer, {"error": f"Action inválida: {action}"}, "400 Bad Request")
+
+
+async def handle_status(writer, query=""):
+    """Estado actual de cada zona (relé activo LOW: value 0 = regando),
+    tamaño de log.txt y memoria libre. Lo usa el mirror del servidor."""
+    zones = {}
+    for zone, pin_num in load_zones_map().items():
+        try:
+            # Pin(n) sin modo no reconfigura el pin, solo lo lee
+            zones[zone] = {"pin": pin_num, "on": Pin(int(pin_num)).value() == 0}
+        except Exception as e:
+            zones[zone] = {"pin": pin_num, "error": str(e)}
+    try:
+        log_size = os.stat("log.txt")[6]
+    except OSError:
+        log_size = 0
+    send_response(writer, {"zones": zones, "log_size": log_size, "mem_free": gc.mem_free()})
+
+
+async def handle_batch(reader, writer, query, headers):
+    """Aplica varias operaciones de zona en un solo request.
+
+    Body (JSON): {"ops": [{"zone": "zona1", "action": "on", "duration": 60}, ...]}
+    Primero se validan todas contra la config, sin tocar los GPIO; si
+    alguna es inválida no se aplica ninguna. Después se configuran y
+    cambian todos los pines seguidos, sin ceder el loop.
+    """
+    content_length = int(headers.get("Content-Length", 0))
+    if content_length == 0:
+        send_response(writer, {"error": "Content-Length requerido"}, "411 Length Required")
+        return
+
+    try:
+        ops = json.loads(await reader.read_body()).get("ops", [])
+    except Exception as e:
+        send_response(writer, {"error": f"Body inválido: {e}"}, "400 Bad Request")
+        return
+
+    # Validar todo antes de tocar un solo pin
+    zones_map = load_zones_map()
+    plan = []
+    errors = []
+    for i, op in enumerate(ops):
+        zone = str(op.get("zone", ""))
+        if zone.isdigit():
+            zone = f"zona{zone}"
+        action = str(op.get("action", "on")).lower()
+        duration = op.get("duration")
+        if zone not in zones_map:
+            errors.append({"op": i, "error": f"Zona '{zone}' no encontrada en config"})
+        elif action not in ("on", "off"):
+            errors.append({"op": i, "error": f"Action inválida: {action}"})
+        else:
+            try:
+                pin_num = int(zones_map[zone])
+                dur = int(duration) if duration else None
+            except Exception as e:
+                errors.append({"op": i, "error": f"Valor inválido: {e}"})
+                continue
+            plan.append((zone, action, pin_num, dur))
+
+    if not ops or errors:
+        send_response(writer, {"error": "Batch rechazado, no se aplicó nada", "errors": errors or "sin ops"},
+                      "400 Bad Request")
+        return
+
+    results = []
+    for zone, action, pin_num, dur in plan:
+        try:
+            p = Pin(pin_num, Pin.OUT)
+        except Exception as e:
+            results.append({"zone": zone, "action": action, "pin": pin_num,
+                            "error": f"No se pudo inicializar Pin {pin_num}: {e}"})
+            continue
+        p.value(0 if action == "on" else 1)
+        if action == "on" and dur and dur > 0:
+            asyncio.create_task(_delayed_off(p, zone, pin_num, dur))
+        results.append({"zone": zone, "action": action, "pin": pin_num, "duration": dur})
+
+    log(f"Endpoint: batch aplicado via /batch: {[(r['zone'], r['action']) for r in results]}")
+    send_response(writer, {"status": "ok", "results": results})
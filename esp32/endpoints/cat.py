@@ -1,23 +1,110 @@
 import os
-from server_utils import send_response, parse_query
+import ujson as json
+from http_parser import parse_query
+from server_utils import send_response, send_head, negotiate, ChunkedBody, log
 
+# El archivo se manda de a CAT_CHUNK bytes desde un único buffer: la
+# memoria usada no depende del tamaño del archivo
+CAT_CHUNK = 512
 
-def check_file_exist(path, writer):
-    try:
-        # Esto falla si el archivo no existe
-        stat_info = os.stat(path)
-    except OSError:
-        send_response(writer, {"error": f"Archivo no encontrado: {path}"}, "404 Not Found")
+
+def _utf8_cut(buf, n):
+    """Hasta dónde se puede decodificar buf[:n] sin partir un carácter UTF-8."""
+    i = n - 1
+    while i >= 0 and i >= n - 3 and buf[i] & 0xC0 == 0x80:
+        i -= 1
+    if i < 0:
+        return n
+    lead = buf[i]
+    need = 4 if lead >= 0xF0 else 3 if lead >= 0xE0 else 2 if lead >= 0xC0 else 1
+    return i if n - i < need else n
+
+
+async def _send_raw(writer, f, size):
+    """Bytes tal cual (application/octet-stream), con Content-Length; chunked si va comprimido."""
+    buf = bytearray(CAT_CHUNK)
+    mv = memoryview(buf)
+    encoding = negotiate(writer, size)
+    if encoding:
+        send_head(writer, content_type="application/octet-stream", encoding=encoding)
+        body = ChunkedBody(writer, encoding)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            await body.write(mv[:n])
+        await body.end()
         return
 
+    send_head(writer, content_type="application/octet-stream", length=size)
+    sent = 0
+    while sent < size:
+        n = f.readinto(buf)
+        if not n:
+            break
+        writer.write(mv[:min(n, size - sent)])
+        await writer.drain()
+        sent += n
+    if sent != size:
+        # El archivo cambió mientras se mandaba: la respuesta quedó mal, se corta
+        writer.keep_alive = False
+
+
+async def _send_json(writer, filename, f, size):
+    """{"file": ..., "content": ...} codificado de a pedazos, con chunked."""
+    encoding = negotiate(writer, size)
+    send_head(writer, encoding=encoding)
+    body = ChunkedBody(writer, encoding)
+    await body.write(b'{"file": ' + json.dumps(filename).encode() + b', "content": "')
+    buf = bytearray(CAT_CHUNK)
+    mv = memoryview(buf)
+    carry = 0  # bytes de un carácter partido que pasan al próximo pedazo
+    while True:
+        n = f.readinto(mv[carry:])
+        end = carry + (n or 0)
+        if not end:
+            break
+        cut = _utf8_cut(buf, end) if n else end
+        # dumps de un str da "...", con el escape JSON hecho: se mandan las comillas de adentro
+        piece = json.dumps(bytes(mv[:cut]).decode())
+        await body.write(piece[1:-1].encode())
+        carry = end - cut
+        if carry:
+            buf[:carry] = bytes(mv[cut:end])
+        if not n:
+            break
+    await body.write(b'"}')
+    await body.end()
+
+
 async def handle(writer, query):
+    """Parametros (query):
+    - filename: archivo a leer
+    - raw: '1' manda los bytes tal cual (application/octet-stream); si no,
+      {"file": ..., "content": ...} como JSON
+    """
     params = parse_query(query)
     filename = params.get("filename")
     if not filename:
         send_response(writer, {"error": "Falta parametro filename"}, "400 Bad Request")
         return
 
-    check_file_exist(filename, writer)
-    with open(filename) as f:
-        content = f.read()
-    send_response(writer, {"file": filename, "content": content})
+    try:
+        size = os.stat(filename)[6]
+        f = open(filename, "rb")
+    except OSError:
+        send_response(writer, {"error": f"Archivo no encontrado: {filename}"}, "404 Not Found")
+        return
+
+    try:
+        if params.get("raw") in ("1", "true"):
+            await _send_raw(writer, f, size)
+        else:
+            await _send_json(writer, filename, f, size)
+    except Exception as e:
+        # La cabecera ya salió: no se puede mandar un 500, se corta la conexión
+        # y el cliente ve la respuesta incompleta
+        log(f"Error mandando {filename}: {e}")
+        writer.keep_alive = False
+    finally:
+        f.close()
@@ -1,42 +1,15 @@
-from server_utils import send_response, parse_query, log
+from http_parser import parse_query
+from server_utils import send_response, log
 from machine import Pin
 import ujson as json
 
 
-def url_decode(s):
-    """Decodifica una cadena URL encoded para MicroPython"""
-    if not s:
-        return s
-    
-    # Reemplazar %XX con caracteres
-    result = []
-    i = 0
-    while i < len(s):
-        if s[i] == '%' and i + 2 < len(s):
-            try:
-                hex_str = s[i+1:i+3]
-                char_code = int(hex_str, 16)
-                result.append(chr(char_code))
-                i += 3
-            except:
-                result.append(s[i])
-                i += 1
-        elif s[i] == '+':
-            result.append(' ')
-            i += 1
-        else:
-            result.append(s[i])
-            i += 1
-    
-    return ''.join(result)
-
-
 async def handle(writer, query=""):
     """
     Ejecuta código Python en el ESP32.
     
     Parametros (query):
-    - code: código Python a ejecutar (URL encoded)
+    - code: código Python a ejecutar (URL encoded, parse_query ya lo decodifica)
     
     Ejemplo: /execute?code=pin=Pin(2,Pin.OUT)%0Apin.on()
     Retorna: {"result": salida, "error": null} o {"result": null, "error": mensaje}
@@ -49,9 +22,6 @@ async def handle(writer, query=""):
         return
     
     try:
-        # Decodificar URL encoding
-        code = url_decode(code)
-        
         # Log del código recibido
         log(f"Received code: {code[:50]}...")
         
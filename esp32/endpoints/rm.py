@@ -1,5 +1,6 @@
 import os
-from server_utils import send_response, parse_query
+from http_parser import parse_query
+from server_utils import send_response
 
 async def handle(writer, query):
     params = parse_query(query)
@@ -1,4 +1,5 @@
-from server_utils import send_response, parse_query
+from http_parser import parse_query
+from server_utils import send_response
 import os
 
 async def handle(reader, writer, query, headers):
@@ -28,15 +29,17 @@ async def handle(reader, writer, query, headers):
     try:
         # Crea el path si no existe
         mkdirs(filename)
-        # Leer contenido en chunks y escribirlo
+        # Leer contenido en chunks y escribirlo (siempre al mismo buffer)
+        buf = bytearray(512)
+        mv = memoryview(buf)
         with open(filename, "wb") as f:
             bytes_read = 0
             while bytes_read < content_length:
-                chunk = await reader.read(min(512, content_length - bytes_read))
-                if not chunk:
+                n = await reader.readinto(buf)
+                if not n:
                     break
-                f.write(chunk)
-                bytes_read += len(chunk)
+                f.write(mv[:n])
+                bytes_read += n
 
         send_response(writer, {"status": "Archivo guardado", "file": filename})
 
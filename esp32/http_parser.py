@@ -0,0 +1,212 @@
+"""
+Parser HTTP del servidor del ESP32, pensado para no ensuciar el heap.
+
+- La cabecera (línea del request + headers) se lee con readinto a un
+  buffer fijo por conexión, de HTTP_HEAD_MAX bytes: si no entra, 431.
+- De los headers solo se guardan los que se usan (WANTED), sin armar
+  strings intermedios por cada línea.
+- El token de Basic auth se calcula una vez al importar.
+- La query se separa y se decodifica (%XX y '+') en una sola pasada.
+"""
+import ubinascii
+import config
+
+HTTP_HEAD_MAX = getattr(config, "HTTP_HEAD_MAX", 1024)
+
+# (nombre en minúscula con el \r\n de la línea anterior, clave en el dict)
+WANTED = (
+    (b"\r\nauthorization:", "Authorization"),
+    (b"\r\ncontent-length:", "Content-Length"),
+    (b"\r\ncontent-type:", "Content-Type"),
+    (b"\r\nconnection:", "Connection"),
+    (b"\r\naccept-encoding:", "Accept-Encoding"),
+)
+
+AUTH_TOKEN = "Basic " + ubinascii.b2a_base64(b"%s:%s" % (
+    config.HTTP_USER.encode(), config.HTTP_PASS.encode())).decode().strip()
+
+
+class HttpError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def check_auth(headers):
+    return headers.get("Authorization") == AUTH_TOKEN
+
+
+# ---------- Query ----------
+
+def _hexval(c):
+    if 48 <= c <= 57:
+        return c - 48
+    c |= 32
+    if 97 <= c <= 102:
+        return c - 87
+    return -1
+
+
+def unquote(s):
+    """Decodifica %XX y '+' en una pasada; si no hay nada que decodificar devuelve el mismo str."""
+    if "%" not in s and "+" not in s:
+        return s
+    src = s.encode()
+    out = bytearray(len(src))
+    i = n = 0
+    size = len(src)
+    while i < size:
+        c = src[i]
+        if c == 37 and i + 2 < size:  # '%'
+            hi = _hexval(src[i + 1])
+            lo = _hexval(src[i + 2])
+            if hi >= 0 and lo >= 0:
+                c = hi * 16 + lo
+                i += 2
+        elif c == 43:  # '+'
+            c = 32
+        out[n] = c
+        n += 1
+        i += 1
+    return out[:n].decode()
+
+
+def parse_query(query):
+    params = {}
+    i = 0
+    size = len(query)
+    while i < size:
+        j = query.find("&", i)
+        if j < 0:
+            j = size
+        eq = query.find("=", i, j)
+        if eq >= 0:
+            params[unquote(query[i:eq])] = unquote(query[eq + 1:j])
+        i = j + 1
+    return params
+
+
+# ---------- Conexión ----------
+
+class Conn:
+    """
+    Una conexión HTTP. Hace de reader y de writer para los handlers:
+    read()/readinto() no pasan del Content-Length del request (lo que
+    sigue es del request siguiente) y send_response mira keep_alive para
+    el header Connection.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.buf = bytearray(HTTP_HEAD_MAX)
+        self.mv = memoryview(self.buf)
+        self.start = 0  # [start, end): leído del socket y todavía sin usar
+        self.end = 0
+        self.keep_alive = True
+        self.accept_encoding = ""  # del request actual, lo mira send_response
+        self.body_left = 0
+
+    async def _fill(self):
+        if self.start:
+            n = self.end - self.start
+            if n:
+                self.buf[:n] = bytes(self.mv[self.start:self.end])
+            self.start, self.end = 0, n
+        if self.end == len(self.buf):
+            raise HttpError("431 Request Header Fields Too Large")
+        n = await self.reader.readinto(self.mv[self.end:])
+        if not n:
+            return False
+        self.end += n
+        return True
+
+    async def read_head(self):
+        """(método, path, versión, headers) del próximo request; None si el cliente cerró."""
+        while True:
+            if self.end > self.start:
+                data = bytes(self.mv[self.start:self.end])
+                i = data.find(b"\r\n\r\n")
+                if i >= 0:
+                    break
+            if not await self._fill():
+                if self.end > self.start:
+                    raise HttpError("400 Bad Request")
+                return None
+        self.start += i + 4
+
+        eol = data.find(b"\r\n", 0, i)
+        if eol < 0:
+            eol = i
+        sp1 = data.find(b" ", 0, eol)
+        if sp1 <= 0:
+            raise HttpError("400 Bad Request")
+        sp2 = data.find(b" ", sp1 + 1, eol)
+        if sp2 < 0:
+            sp2 = eol
+        method = data[:sp1].decode()
+        path = data[sp1 + 1:sp2].decode()
+        version = data[sp2 + 1:eol].decode()
+
+        headers = {}
+        low = data[eol:i].lower()
+        for name, key in WANTED:
+            p = low.find(name)
+            if p >= 0:
+                p += len(name)
+                e = low.find(b"\r\n", p)
+                if e < 0:
+                    e = len(low)
+                headers[key] = data[eol + p:eol + e].strip().decode()
+
+        self.body_left = int(headers.get("Content-Length", 0))
+        return method, path, version, headers
+
+    async def readinto(self, buf):
+        """Body en un buffer del que llama (sin allocar). Devuelve los bytes leídos, 0 al final."""
+        n = min(len(buf), self.body_left)
+        if n <= 0:
+            return 0
+        avail = self.end - self.start
+        if avail:
+            n = min(n, avail)
+            buf[:n] = self.mv[self.start:self.start + n]
+            self.start += n
+        else:
+            n = await self.reader.readinto(memoryview(buf)[:n]) or 0
+        self.body_left -= n
+        return n
+
+    async def read(self, n=-1):
+        n = self.body_left if n < 0 else min(n, self.body_left)
+        if n <= 0:
+            return b""
+        avail = self.end - self.start
+        if avail:
+            n = min(n, avail)
+            chunk = bytes(self.mv[self.start:self.start + n])
+            self.start += n
+        else:
+            chunk = await self.reader.read(n)
+        self.body_left -= len(chunk)
+        return chunk
+
+    async def read_body(self):
+        """Body entero (lo que indica Content-Length) como bytes."""
+        if self.body_left <= self.end - self.start:
+            return await self.read()
+        body = bytearray(self.body_left)
+        mv = memoryview(body)
+        got = 0
+        while got < len(body):
+            n = await self.readinto(mv[got:])
+            if not n:
+                break
+            got += n
+        return bytes(mv[:got])
+
+    def write(self, data):
+        self.writer.write(data)
+
+    async def drain(self):
+        await self.writer.drain()
@@ -84,6 +84,7 @@ mpremote connect /dev/ttyUSB0 fs cp esp32/endpoints/rm.py :endpoints/
 mpremote connect /dev/ttyUSB0 fs cp esp32/endpoints/__init__.py :endpoints/
 mpremote connect /dev/ttyUSB0 fs cp esp32/server.py :
 mpremote connect /dev/ttyUSB0 fs cp esp32/server_utils.py :
+mpremote connect /dev/ttyUSB0 fs cp esp32/http_parser.py :
 mpremote connect /dev/ttyUSB0 fs cp esp32/main.py :
 mpremote connect /dev/ttyUSB0 fs cp esp32/task.py :
 '''
\ No newline at end of file
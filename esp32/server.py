@@ -1,9 +1,76 @@
+import gc
+import sys
+import time
 import uasyncio as asyncio
 import network
-import ubinascii
 import config
-from server_utils import log, reset, send_response, parse_headers, _err_payload
-from endpoints import ls, cat, upload, rm, tail, actions, excecute
+from http_parser import Conn, HttpError, check_auth
+from server_utils import log, reset, send_response, _err_payload
+
+# ---------- Rutas ----------
+# (método, ruta) -> (módulo de endpoints/, función, recibe el body)
+# "*" acepta cualquier método. Los módulos no se importan al arrancar:
+# se cargan en el primer request que los usa.
+ROUTES = {
+    ("*", "/ls"): ("ls", "handle", False),
+    ("*", "/tail"): ("tail", "handle", False),
+    ("*", "/cat"): ("cat", "handle", False),
+    ("POST", "/upload"): ("upload", "handle", True),
+    ("*", "/rm"): ("rm", "handle", False),
+    ("*", "/zone"): ("actions", "handle", False),
+    ("POST", "/batch"): ("actions", "handle_batch", True),
+    ("*", "/status"): ("actions", "handle_status", False),
+    ("*", "/execute"): ("excecute", "handle", False),
+}
+
+# Con menos memoria libre que esto se descargan los módulos menos usados
+LAZY_MIN_FREE = getattr(config, "LAZY_MIN_FREE", 30000)
+
+_loaded = {}  # módulo -> [módulo, último uso (ticks_ms), requests atendidos]
+
+
+def _evict(keep):
+    """Descarga módulos de endpoints, del menos usado recientemente, hasta tener LAZY_MIN_FREE."""
+    gc.collect()
+    for name in sorted(_loaded, key=lambda n: _loaded[n][1]):
+        if gc.mem_free() >= LAZY_MIN_FREE:
+            break
+        if name == keep:
+            continue
+        del _loaded[name]
+        sys.modules.pop("endpoints." + name, None)
+        pkg = sys.modules.get("endpoints")
+        if pkg is not None and hasattr(pkg, name):
+            delattr(pkg, name)
+        gc.collect()
+        log(f"Endpoint {name} descargado, mem_free={gc.mem_free()}")
+
+
+def _module(name):
+    entry = _loaded.get(name)
+    if entry is None:
+        t0 = time.ticks_ms()
+        mod = __import__("endpoints." + name, None, None, ("handle",))
+        entry = _loaded[name] = [mod, 0, 0]
+        gc.collect()
+        log(f"Endpoint {name} cargado en {time.ticks_diff(time.ticks_ms(), t0)} ms, mem_free={gc.mem_free()}")
+        if gc.mem_free() < LAZY_MIN_FREE:
+            _evict(name)
+    entry[1] = time.ticks_ms()
+    entry[2] += 1
+    return entry[0]
+
+
+def routes_info():
+    """Módulos cargados y memoria libre (GET /routes)."""
+    return {
+        "loaded": {name: {"hits": e[2], "idle_ms": time.ticks_diff(time.ticks_ms(), e[1])}
+                   for name, e in _loaded.items()},
+        "lazy": sorted(set(r[0] for r in ROUTES.values()) - set(_loaded)),
+        "mem_free": gc.mem_free(),
+        "lazy_min_free": LAZY_MIN_FREE,
+        "alloc_per_request": _alloc[1] // _alloc[0] if _alloc[0] else None,
+    }
 
 # ---------- WiFi ----------
 def connect_wifi(ssid: str, password: str, ip: str, netmask: str, gateway: str, dns: str):
@@ -24,88 +91,125 @@ def connect_wifi(ssid: str, password: str, ip: str, netmask: str, gateway: str,
     return sta_if
 
 
-# ---------- Auth ----------
-def check_auth(header):
-    if not header or "Authorization" not in header:
-        return False
-    auth_value = header["Authorization"].split()[1]
-    expected = ubinascii.b2a_base64(b"%s:%s" % (
-        config.HTTP_USER.encode(), config.HTTP_PASS.encode())).decode().strip()
-    return auth_value == expected
-
-
 # ---------- Cliente ----------
-async def handle_client(reader, writer):
-    try:
-        # Primera línea
-        req_line = await reader.readline()
-        if not req_line:
-            await writer.aclose()
-            return
-
-        parts = req_line.decode().split(" ")
-        if len(parts) < 2:
-            await writer.aclose()
-            return
-
-        method, path = parts[0], parts[1]
-        route = path.split("?")[0]
-        query = path.split("?")[1] if "?" in path else ""
-        query = query.replace('-_-', '/')
-
-        # Headers
-        headers_raw = ""
-        while True:
-            line = await reader.readline()
-            if line == b"\r\n":
-                break
-            headers_raw += line.decode()
-        headers = parse_headers(headers_raw)
-
-        # Auth
-        if not check_auth(headers):
-            resp = 'HTTP/1.1 401 Unauthorized\r\nWWW-Authenticate: Basic realm="ESP32"\r\n\r\n'
-            writer.write(resp.encode())
-            await writer.aclose()
-            return
-
-        # ---------- Dispatch ----------
-        log(f"{route}, {query}")
-        if route == "/ls":
-            await ls.handle(writer, query)
-        
-        elif route == "/tail":
-            await tail.handle(writer, query)
-
-        elif route == "/cat":
-            await cat.handle(writer, query)
+# Conexiones persistentes (HTTP/1.1 keep-alive): el proxy reusa la misma
+# conexión TCP para muchos requests en vez de abrir una por llamada.
+HTTP_MAX_CONNECTIONS = getattr(config, "HTTP_MAX_CONNECTIONS", 4)  # cada una ocupa buffers del heap
+HTTP_IDLE_S = getattr(config, "HTTP_IDLE_S", 30)  # sin requests por este tiempo, se cierra
+HTTP_MAX_REQUESTS = getattr(config, "HTTP_MAX_REQUESTS", 100)  # por conexión
+# Con esto en True, /routes muestra los bytes allocados por request (gc.mem_alloc)
+HTTP_ALLOC_STATS = getattr(config, "HTTP_ALLOC_STATS", False)
+# Body sin leer por el handler que todavía vale la pena descartar para seguir en la conexión
+_DRAIN_MAX = 4096
+_scratch = bytearray(256)
+
+_active = 0
+_alloc = [0, 0]  # requests medidos, bytes allocados
+
+
+async def _serve(conn, head, served):
+    method, path, version, headers = head
+    q = path.find("?")
+    route = path if q < 0 else path[:q]
+    query = "" if q < 0 else path[q + 1:].replace('-_-', '/')
+
+    connection = headers.get("Connection", "").lower()
+    if version == "HTTP/1.0":
+        conn.keep_alive = connection == "keep-alive"
+    else:
+        conn.keep_alive = connection != "close"
+    if served >= HTTP_MAX_REQUESTS:
+        conn.keep_alive = False
+    conn.accept_encoding = headers.get("Accept-Encoding", "").lower()
+
+    # Auth
+    if not check_auth(headers):
+        conn.keep_alive = False
+        conn.write(b'HTTP/1.1 401 Unauthorized\r\nWWW-Authenticate: Basic realm="ESP32"\r\n'
+                   b'Content-Length: 0\r\nConnection: close\r\n\r\n')
+        return
+
+    # ---------- Dispatch ----------
+    log(f"{route}, {query}")
+    target = ROUTES.get((method, route)) or ROUTES.get(("*", route))
+    if target is not None:
+        name, func, with_body = target
+        handler = getattr(_module(name), func)
+        if with_body:
+            await handler(conn, conn, query, headers)
+        else:
+            await handler(conn, query)
 
-        elif route == "/upload" and method == "POST":
-            await upload.handle(reader, writer, query, headers)
+    elif route == "/routes":
+        send_response(conn, routes_info())
 
-        elif route == "/rm":
-            await rm.handle(writer, query)
+    elif route == "/reset":
+        conn.keep_alive = False
+        send_response(conn, {"status": "Reseteando controlador.."})
+        asyncio.sleep(10)
+        await reset()
 
-        elif route == "/zone":
-            await actions.handle(writer, query)
+    else:
+        send_response(conn, {"error": f"Ruta {route} no encontrada"}, "404 Not Found")
 
-        elif route == "/execute":
-            await excecute.handle(writer, query)
+    # Body que el handler no leyó (ej. rechazó el request antes): se
+    # descarta si es chico, si no se corta la conexión
+    if conn.body_left > _DRAIN_MAX:
+        conn.keep_alive = False
+    while conn.keep_alive and conn.body_left > 0:
+        if not await conn.readinto(_scratch):
+            conn.keep_alive = False
 
-        elif route == "/reset":
-            send_response(writer, {"status": "Reseteando controlador.."})
-            asyncio.sleep(10)
-            await reset()
 
-        else:
-            send_response(writer, {"error": f"Ruta {route} no encontrada"}, "404 Not Found")
+async def handle_client(reader, writer):
+    global _active
+    if _active >= HTTP_MAX_CONNECTIONS:
+        # Sin lugar: se rechaza enseguida en vez de gastar heap
+        writer.write(b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: 1\r\n"
+                     b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+        try:
+            await writer.drain()
+            await writer.aclose()
+        except:
+            pass
+        return
 
-        await writer.drain()
-        await writer.aclose()
+    _active += 1
+    conn = Conn(reader, writer)
+    served = 0
+    try:
+        while conn.keep_alive:
+            try:
+                head = await asyncio.wait_for(conn.read_head(), HTTP_IDLE_S)
+            except asyncio.TimeoutError:
+                break
+            except HttpError as e:
+                conn.keep_alive = False
+                send_response(conn, {"error": e.status}, e.status)
+                break
+            if head is None:
+                break
+            served += 1
+            if HTTP_ALLOC_STATS:
+                before = gc.mem_alloc()
+            await _serve(conn, head, served)
+            if HTTP_ALLOC_STATS:
+                used = gc.mem_alloc() - before
+                if used >= 0:  # si corrió el GC en el medio, la muestra no sirve
+                    _alloc[0] += 1
+                    _alloc[1] += used
+            await writer.drain()
 
     except Exception as e:
         print("Error:", repr(e))
-        send_response(writer, _err_payload(e), "500 Internal Server Error")
+        conn.keep_alive = False
+        send_response(conn, _err_payload(e), "500 Internal Server Error")
+        try:
+            await writer.drain()
+        except:
+            pass
+    finally:
+        _active -= 1
         try:
             await writer.aclose()
         except:
@@ -114,7 +218,8 @@ async def handle_client(reader, writer):
 
 # ---------- Servidor ----------
 async def start_server():
-    log("Servidor escuchando en 0.0.0.0:80")
+    gc.collect()
+    log(f"Servidor escuchando en 0.0.0.0:80 (t={time.ticks_ms()} ms desde el boot, mem_free={gc.mem_free()})")
     connect_wifi(
         ssid=config.WIFI_SSID,
         password=config.WIFI_PASS,
@@ -1,7 +1,13 @@
+import io
 import urequests
 import uos
 import time
 import ujson as json
+import config
+try:
+    import deflate
+except ImportError:  # firmware sin el módulo: se responde sin comprimir
+    deflate = None
 
 from time_utils import now_local
 
@@ -13,32 +19,124 @@ def reset():
     machine.reset()
 
 
+# --- compresión (Content-Encoding) ---
+
+HTTP_DEFLATE = getattr(config, "HTTP_DEFLATE", True)
+# Respuestas más chicas que esto no ganan nada comprimidas
+HTTP_DEFLATE_MIN = getattr(config, "HTTP_DEFLATE_MIN", 256)
+# Ventana de 2**wbits bytes: chica para que el compresor ocupe poco heap
+HTTP_DEFLATE_WBITS = getattr(config, "HTTP_DEFLATE_WBITS", 10)
+# send_response comprime en memoria (body + comprimido a la vez en el heap):
+# más grande que esto va sin comprimir. Lo grande se manda de a pedazos
+# con send_head + ChunkedBody, que sí comprime al vuelo (ver endpoints/cat.py)
+HTTP_DEFLATE_INLINE_MAX = getattr(config, "HTTP_DEFLATE_INLINE_MAX", 4096)
+
+
+def negotiate(writer, size=None):
+    """'deflate', 'gzip' o None según el Accept-Encoding del request."""
+    accepted = getattr(writer, "accept_encoding", "")
+    if not (HTTP_DEFLATE and deflate and accepted) or (size is not None and size < HTTP_DEFLATE_MIN):
+        return None
+    for encoding in ("deflate", "gzip"):
+        for token in accepted.split(","):
+            name, _, q = token.strip().partition(";")
+            if name.strip() == encoding and q.replace(" ", "") not in ("q=0", "q=0.0"):
+                return encoding
+    return None
+
+
+class _Sink(io.IOBase):
+    """Junta lo que va sacando DeflateIO, para mandarlo al socket."""
+
+    def __init__(self):
+        self.parts = []
+
+    def write(self, buf):
+        self.parts.append(bytes(buf))
+        return len(buf)
+
+    def take(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+class Compressor:
+    """deflate (formato zlib, como pide HTTP) o gzip, de a pedazos."""
+
+    def __init__(self, encoding):
+        self.sink = _Sink()
+        fmt = deflate.GZIP if encoding == "gzip" else deflate.ZLIB
+        self.z = deflate.DeflateIO(self.sink, fmt, HTTP_DEFLATE_WBITS)
+
+    def compress(self, data):
+        self.z.write(data)
+        return self.sink.take()
+
+    def finish(self):
+        self.z.close()
+        return self.sink.take()
+
+
 def send_response(writer, data, status="200 OK", content_type="application/json"):
     if isinstance(data, dict):
         data = json.dumps(data)
-    resp = "HTTP/1.1 {}\r\nContent-Type: {}\r\n\r\n{}".format(
-        status, content_type, data)
-    writer.write(resp.encode())
-
-
-def parse_headers(header_text):
-    headers = {}
-    lines = header_text.split("\r\n")
-    for line in lines:
-        if ":" in line:
-            key, value = line.split(":", 1)
-            headers[key.strip()] = value.strip()
-    return headers
-
-
-def parse_query(query):
-    params = {}
-    if query:
-        for pair in query.split("&"):
-            if "=" in pair:
-                k, v = pair.split("=", 1)
-                params[k] = v
-    return params
+    body = data.encode() if isinstance(data, str) else data
+    encoding = negotiate(writer, len(body)) if len(body) <= HTTP_DEFLATE_INLINE_MAX else None
+    if encoding:
+        z = Compressor(encoding)
+        body = z.compress(body) + z.finish()
+    # Con Content-Length el cliente sabe dónde termina la respuesta y puede
+    # reusar la conexión (ver Conn en http_parser.py)
+    connection = "keep-alive" if getattr(writer, "keep_alive", False) else "close"
+    head = "HTTP/1.1 {}\r\nContent-Type: {}\r\n{}Content-Length: {}\r\nConnection: {}\r\n\r\n".format(
+        status, content_type, "Content-Encoding: {}\r\n".format(encoding) if encoding else "",
+        len(body), connection)
+    writer.write(head.encode() + body)
+
+
+def send_head(writer, status="200 OK", content_type="application/json", length=None, encoding=None):
+    """Solo la cabecera, para respuestas que se mandan de a pedazos.
+    Sin length la respuesta va con Transfer-Encoding: chunked (ver ChunkedBody)."""
+    connection = "keep-alive" if getattr(writer, "keep_alive", False) else "close"
+    framing = "Transfer-Encoding: chunked" if length is None else "Content-Length: {}".format(length)
+    if encoding:
+        framing = "Content-Encoding: {}\r\n{}".format(encoding, framing)
+    head = "HTTP/1.1 {}\r\nContent-Type: {}\r\n{}\r\nConnection: {}\r\n\r\n".format(
+        status, content_type, framing, connection)
+    writer.write(head.encode())
+
+
+async def send_chunk(writer, data):
+    """Un chunk de una respuesta chunked; data vacío termina la respuesta.
+    Espera a que salga (drain) para no acumular la respuesta en el heap."""
+    writer.write(b"%x\r\n" % len(data))
+    if data:
+        writer.write(data)
+    writer.write(b"\r\n")
+    await writer.drain()
+
+
+class ChunkedBody:
+    """Cuerpo chunked, comprimido al vuelo si encoding no es None."""
+
+    def __init__(self, writer, encoding=None):
+        self.writer = writer
+        self.z = Compressor(encoding) if encoding else None
+
+    async def write(self, data):
+        if self.z:
+            data = self.z.compress(data)
+        # Un chunk vacío terminaría la respuesta: el compresor a veces no saca nada
+        if data:
+            await send_chunk(self.writer, data)
+
+    async def end(self):
+        if self.z:
+            tail = self.z.finish()
+            if tail:
+                await send_chunk(self.writer, tail)
+        await send_chunk(self.writer, b"")
 
 
 def _err_payload(e):
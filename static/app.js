@@ -6,8 +6,12 @@ const runBtn = $("run");
 const cmdInput = $("cmd");
 
 // --- Logs ---
+// Stream en vivo (SSE): el server empuja cada línea apenas llega por POST /api/logs.
+// Si se corta, EventSource reconecta solo y manda Last-Event-ID para no perder líneas.
+const MAX_LOG_LINES = 500;
 let running = false;
-let intervalId = null;
+let source = null;
+let logLines = [];
 
 const toggleBtn = document.getElementById("toggle");
 const logbox = document.getElementById("logbox");
@@ -17,23 +21,26 @@ toggleBtn.addEventListener("click", () => {
   toggleBtn.textContent = running ? "OFF" : "ON";
 
   if (running) {
-    fetchLogs();
-    intervalId = setInterval(fetchLogs, 30000); // cada 10s
-  } else {
-    clearInterval(intervalId);
+    startLogStream();
+  } else if (source) {
+    source.close();
+    source = null;
   }
 });
 
-async function fetchLogs() {
-  try {
-    const res = await fetch("/api/logs/tail?n=20");
-    const data = await res.json();
-    console.log(data);
-    logbox.textContent = data.lines.join("\n");
-    logbox.scrollTop = logbox.scrollHeight;
-  } catch (err) {
-    console.error(err);
-  }
+function startLogStream() {
+  logLines = [];
+  source = new EventSource("/api/logs/stream?n=20");
+  source.onmessage = (ev) => {
+    logLines.push(ev.data);
+    if (logLines.length > MAX_LOG_LINES) logLines = logLines.slice(-MAX_LOG_LINES);
+    const atBottom = logbox.scrollTop + logbox.clientHeight >= logbox.scrollHeight - 4;
+    logbox.textContent = logLines.join("\n");
+    if (atBottom) logbox.scrollTop = logbox.scrollHeight;
+  };
+  source.onerror = (err) => {
+    console.error("stream de logs:", err);
+  };
 }
 
 
@@ -58,6 +58,26 @@ document.addEventListener('DOMContentLoaded', () => {
     });
   });
 
+  // Estado inicial desde el espejo del servidor (no consulta al ESP)
+  async function loadZoneStates() {
+    try {
+      const res = await fetch('/api/state/zones');
+      if (!res.ok) return;
+      const zones = (await res.json()).sections.zones.data || {};
+      document.querySelectorAll('.zone-switch').forEach(btn => {
+        const info = zones[`zona${btn.getAttribute('data-zone')}`];
+        if (!info || info.on === undefined) return;
+        const state = info.on ? 'on' : 'off';
+        btn.textContent = `Zona ${btn.getAttribute('data-zone')}: ${state.toUpperCase()}`;
+        btn.setAttribute('data-state', state);
+        updateButtonColor(btn, state);
+      });
+    } catch (err) {
+      console.warn('No se pudo leer /api/state/zones:', err);
+    }
+  }
+  loadZoneStates();
+
   function updateButtonColor(btn, state) {
     if (state === 'on') {
       btn.style.background = '#16a34a'; // green
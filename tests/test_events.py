@@ -0,0 +1,26 @@
+from datetime import date
+
+from app import events
+
+
+DAY = date(2026, 10, 18)
+
+
+def test_scheduler_duration():
+    (ev,) = events.parse_line(DAY, "04:00:00 - Regando zona zona5 (pin 26) de 240 a 252")
+    assert ev[1:] == ("zona5", 26, "on", "scheduler", 12 * 60)
+
+
+def test_scheduler_duration_crosses_midnight():
+    # zona5 "23:55-00:10" de config_riego.json
+    (ev,) = events.parse_line(DAY, "23:55:00 - Regando zona zona5 (pin 26) de 1435 a 10")
+    assert ev[5] == 15 * 60
+
+
+def test_session_across_midnight(tmp_path, monkeypatch):
+    store = events.EventStore(str(tmp_path / "events.sqlite3"))
+    monkeypatch.setattr(events, "store", store)
+    store.ingest(DAY, ["23:55:00 - Regando zona zona5 (pin 26) de 1435 a 10"])
+    store.ingest(date(2026, 10, 19), ["00:10:00 - Riego zona zona5 finalizado"])
+    rows = store.query("SELECT seconds FROM sessions WHERE zone = 'zona5'")
+    assert rows == [{"seconds": 15 * 60}]
@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from app import log_ingest, log_writer, logs_api
+
+
+def _body(*records):
+    return "\n".join(json.dumps({"seq": seq, "line": line}) for seq, line in records).encode()
+
+
+def _setup(tmp_path, monkeypatch, delay):
+    written = []
+
+    async def slow_submit(log_file, lines, durable=False, dedup=True):
+        await asyncio.sleep(delay)
+        written.extend(lines)
+
+    monkeypatch.setattr(log_ingest, "marks", log_ingest.HighWaterMarks(tmp_path / "ingest_hwm.json"))
+    monkeypatch.setattr(log_ingest, "LOG_BULK_TIMEOUT_S", 0.05)
+    monkeypatch.setattr(log_writer.writer, "submit", slow_submit)
+    app = FastAPI()
+    app.include_router(logs_api.router, prefix="/api")
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+    return client, written
+
+
+def test_slow_writer_retry_does_not_duplicate(tmp_path, monkeypatch):
+    client, written = _setup(tmp_path, monkeypatch, delay=0.2)
+    body = _body((1, "06:00:00 - a"), (2, "06:00:01 - b"))
+
+    async def run():
+        async with client:
+            first = await client.post("/api/logs/bulk?device=esp1", content=body)
+            # El writer todavía no terminó: el reintento también espera y corta
+            early = await client.post("/api/logs/bulk?device=esp1", content=body)
+            await asyncio.sleep(0.3)
+            retry = await client.post("/api/logs/bulk?device=esp1", content=body)
+            return first, early, retry
+
+    first, early, retry = asyncio.run(run())
+    assert first.status_code == 503
+    assert early.status_code == 503
+    assert retry.status_code == 200
+    assert retry.json()["accepted"] == 0
+    assert retry.json()["duplicates"] == 2
+    assert written == ["06:00:00 - a", "06:00:01 - b"]
+    assert log_ingest.marks.get("esp1") == 2
+
+
+def test_retry_after_writer_error_rewrites(tmp_path, monkeypatch):
+    client, written = _setup(tmp_path, monkeypatch, delay=0)
+    calls = []
+
+    async def failing_once(log_file, lines, durable=False, dedup=True):
+        calls.append(lines)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        written.extend(lines)
+
+    monkeypatch.setattr(log_writer.writer, "submit", failing_once)
+    body = _body((1, "06:00:00 - a"))
+
+    async def run():
+        async with client:
+            return (await client.post("/api/logs/bulk?device=esp1", content=body),
+                    await client.post("/api/logs/bulk?device=esp1", content=body))
+
+    failed, retry = asyncio.run(run())
+    assert failed.status_code == 500
+    assert retry.status_code == 200 and retry.json()["accepted"] == 1
+    assert written == ["06:00:00 - a"]